@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Codec benchmark: decode/encode time of API payloads per JSON backend.
+
+Compares the stdlib json module, orjson (when installed) and whichever
+one habitica.codec picked, on the JSON fixtures in benchmarks/fixtures.
+Record fixtures from your own account first (they hold your data, keep
+them out of version control):
+
+    python benchmarks/codec.py --record
+    python benchmarks/codec.py --runs=20
+
+Without recorded fixtures, synthetic documents shaped like /user,
+/tasks/user and /content are generated instead.
+
+Usage: codec.py [--runs=<n>] [--record] [<fixture>...]
+"""
+
+
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+
+# fixture name -> (endpoint path, kwargs) to record it from
+RECORDED = {
+    'user': (('user',), {}),
+    'tasks': (('tasks', 'user'), {}),
+    'completed-todos': (('tasks', 'user'), {'type': 'completedTodos'}),
+    'content': (('content',), {}),
+}
+
+
+def record():
+    sys.path.insert(0, ROOT)
+    from habitica import api, core
+
+    if not os.path.isdir(FIXTURES):
+        os.makedirs(FIXTURES)
+    with api.Habitica(auth=core.load_auth(core.AUTH_CONF)) as hbt:
+        for name, (path, kwargs) in sorted(RECORDED.items()):
+            endpoint = hbt
+            for part in path:
+                endpoint = getattr(endpoint, part)
+            res = endpoint(_raw=True, **kwargs)
+            with open(os.path.join(FIXTURES, name + '.json'), 'wb') as f:
+                f.write(res.content)
+            print('recorded %s (%d KiB)' % (name, len(res.content) // 1024))
+
+
+def synthetic():
+    """Documents roughly the size and shape of a long-lived account's."""
+    def task(i):
+        return {'id': '%08d-0000-4000-8000-000000000000' % i, 'type': 'todo',
+                'text': u'Task number %d ✓' % i, 'notes': 'note ' * 10,
+                'tags': [], 'completed': i % 3 == 0, 'value': i / 7.0,
+                'priority': 1.5, 'date': None, 'checklist': [
+                    {'id': 'c%d' % j, 'text': 'item %d' % j,
+                     'completed': False} for j in range(3)],
+                'history': [{'date': 1600000000000 + j, 'value': j / 3.0}
+                            for j in range(20)]}
+    tasks = {'success': True, 'data': [task(i) for i in range(2000)]}
+    user = {'success': True, 'data': {
+        'items': {'pets': dict(('Pet-%d' % i, i % 50) for i in range(300)),
+                  'food': dict(('Food-%d' % i, i) for i in range(60))},
+        'history': {'exp': [{'date': 1600000000000 + i, 'value': i}
+                            for i in range(3000)]}}}
+    content = {'success': True, 'data': dict(
+        ('section%d' % s, dict(('key%d' % k, {'text': 'Entry %d' % k,
+                                              'notes': 'n' * 200,
+                                              'value': k})
+                               for k in range(400)))
+        for s in range(30))}
+    return {'tasks': json.dumps(tasks).encode('utf8'),
+            'user': json.dumps(user).encode('utf8'),
+            'content': json.dumps(content).encode('utf8')}
+
+
+def load_fixtures(names):
+    fixtures = {}
+    if os.path.isdir(FIXTURES):
+        for filename in sorted(os.listdir(FIXTURES)):
+            name, ext = os.path.splitext(filename)
+            if ext == '.json' and (not names or name in names):
+                with open(os.path.join(FIXTURES, filename), 'rb') as f:
+                    fixtures[name] = f.read()
+    return fixtures or synthetic()
+
+
+def codecs():
+    backends = {'json': (lambda data: json.loads(data.decode('utf8')),
+                         lambda obj: json.dumps(obj).encode('utf8'))}
+    try:
+        import orjson
+    except ImportError:
+        pass
+    else:
+        backends['orjson'] = (orjson.loads, orjson.dumps)
+    sys.path.insert(0, ROOT)
+    from habitica import codec
+    backends['habitica (%s)' % codec.NAME] = (codec.loads, codec.dumps)
+    return backends
+
+
+def best(func, arg, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(arg)
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main(argv):
+    opts = {'--runs': '10'}
+    names = []
+    for arg in argv:
+        if arg == '--record':
+            record()
+            return 0
+        if arg.startswith('--') and '=' in arg:
+            key, value = arg.split('=', 1)
+            opts[key] = value
+        else:
+            names.append(arg)
+    runs = int(opts['--runs'])
+
+    fixtures = load_fixtures(names)
+    print('%-16s %-18s %10s %10s' % ('fixture', 'codec', 'loads ms', 'dumps ms'))
+    for name, data in sorted(fixtures.items()):
+        for codec_name, (loads, dumps) in sorted(codecs().items()):
+            obj = loads(data)
+            print('%-16s %-18s %10.2f %10.2f' % (
+                '%s (%dK)' % (name, len(data) // 1024), codec_name,
+                best(loads, data, runs), best(dumps, obj, runs)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
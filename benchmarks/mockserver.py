@@ -0,0 +1,458 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local stand-in for the Habitica v3 API, for benchmarks and manual runs.
+
+Serves the endpoints api.Habitica calls (/status, /user, /groups/party,
+/content, /tasks/user, /tags, task scoring, checklists, feed, hatch and
+sleep) from a generated account of configurable size, with optional latency,
+gzip compression and a rate limit announced through X-RateLimit-*
+headers and enforced with 429s. Counts requests and bytes both ways.
+
+    python benchmarks/mockserver.py --tasks=1000 --latency=80
+
+then point ~/.config/habitica/auth.cfg at it (url = http://127.0.0.1:8765).
+
+Usage: mockserver.py [--port=<n>] [--tasks=<n>] [--history=<n>]
+                     [--content=<n>] [--latency=<ms>] [--rate-limit=<n>]
+                     [--no-gzip]
+"""
+
+
+import gzip
+import hashlib
+import json
+import re
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+APP_VERSION = '5.0.0'
+RATE_WINDOW = 60  # seconds
+TASK_TYPES = {'habits': 'habit', 'dailys': 'daily', 'todos': 'todo'}
+
+
+def make_account(tasks=100, history=30, content=50, food=8):
+    """
+    A user with `tasks` habits/dailies/todos (as many completed todos
+    again), `history` score history entries per task, `content` entries
+    per /content section and `food` kinds of food in the inventory.
+    """
+    def task(i, task_type, completed=False):
+        return {'id': '%08x-0000-4000-8000-%012x' % (i, i), 'type': task_type,
+                'text': 'Task %d' % i, 'notes': 'Notes for task %d' % i,
+                'tags': ['tag-%d' % (i % 3)] if i % 5 == 0 else [],
+                'completed': completed, 'value': (i % 40) - 20.0,
+                'priority': 1, 'date': None, 'checklist': [
+                    {'id': 'cl-%d-%d' % (i, j), 'text': 'Item %d' % j,
+                     'completed': False} for j in range(i % 4)],
+                'history': [history_entry(i, j, task_type)
+                            for j in range(history)]}
+
+    def history_entry(i, j, task_type):
+        entry = {'date': 1600000000000 + j * 86400000,
+                 'value': ((i + j) % 20 - 10) / 2.0}
+        if task_type == 'daily':
+            entry.update(isDue=j % 7 != 6, completed=(i + j) % 3 != 0)
+        elif task_type == 'habit':
+            entry.update(scoredUp=(i + j) % 4, scoredDown=(i + j) % 2)
+        return entry
+
+    task_list = [task(i, ('habit', 'daily', 'todo')[i % 3])
+                 for i in range(tasks)]
+    task_list += [task(tasks + i, 'todo', completed=True)
+                  for i in range(tasks)]
+    eggs = ['Egg%d' % i for i in range(content)]
+    potions = ['Potion%d' % i for i in range(content)]
+    foods = ['Food%d' % i for i in range(content)]
+    pets = ['%s-%s' % (egg, potion) for egg in eggs[:10] for potion in potions[:10]]
+    user = {
+        '_id': 'mock-user', '_v': 1,
+        'stats': {'lvl': 30, 'class': 'warrior', 'hp': 42.5, 'maxHealth': 50,
+                  'exp': 120, 'toNextLevel': 700, 'mp': 20, 'maxMP': 80,
+                  'gp': 1234.5},
+        'items': {'pets': dict((pet, 5 * (i % 10)) for i, pet in enumerate(pets)),
+                  'mounts': {},
+                  'eggs': dict((egg, 1) for egg in eggs),
+                  'hatchingPotions': dict((potion, 1) for potion in potions),
+                  'food': dict((name, 3) for name in foods[:food]),
+                  'currentPet': pets[0], 'currentMount': ''},
+        'preferences': {'sleep': False},
+        'history': {'exp': [{'date': 1600000000000 + j * 86400000, 'value': j}
+                            for j in range(history * 10)]},
+    }
+    catalogue = {
+        'quests': dict(('quest%d' % i, {'key': 'quest%d' % i,
+                                        'text': 'Quest %d' % i,
+                                        'notes': 'A long quest description ' * 20,
+                                        'boss': {'hp': 500}})
+                       for i in range(content)),
+        'eggs': dict((egg, {'key': egg, 'text': egg, 'notes': 'An egg.'})
+                     for egg in eggs),
+        'hatchingPotions': dict((potion, {'key': potion, 'text': potion})
+                                for potion in potions),
+        'food': dict((food, {'key': food, 'text': food,
+                             'target': potions[i % 10]})
+                     for i, food in enumerate(foods)),
+        'petInfo': dict((pet, {'key': pet, 'text': pet.replace('-', ' ')})
+                        for pet in pets),
+        'gear': dict(('gear%d' % i, {'text': 'Gear %d' % i,
+                                     'notes': 'Shiny. ' * 30})
+                     for i in range(content * 10)),
+    }
+    party = {'_id': 'mock-party', 'quest': {
+        'active': True, 'key': 'quest0', 'progress': {'hp': 321.0,
+                                                      'collect': {}}}}
+    tags = [{'id': 'tag-%d' % i, 'name': name}
+            for i, name in enumerate(['Work', 'Home', 'Errands'])]
+    return {'tasks': task_list, 'user': user, 'party': party,
+            'content': catalogue, 'tags': tags}
+
+
+class MockState(object):
+    """The account served, plus request counters and the rate limit."""
+
+    def __init__(self, latency=0.0, rate_limit=None, gzip=True, **account):
+        self.account_options = account
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.gzip = gzip
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Restore the generated account and zero the counters."""
+        with self.lock:
+            self.account = make_account(**self.account_options)
+            self.requests = 0
+            self.bytes_in = 0
+            self.bytes_out = 0
+            self.routes = {}
+            self.window_start = time.time()
+            self.window_count = 0
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out, 'routes': dict(self.routes)}
+
+    def count(self, route, bytes_in, bytes_out):
+        with self.lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.routes[route] = self.routes.get(route, 0) + 1
+
+    def take_rate_limit(self):
+        """Returns (allowed, remaining, reset epoch) for one request."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= RATE_WINDOW:
+                self.window_start, self.window_count = now, 0
+            reset = self.window_start + RATE_WINDOW
+            if self.rate_limit is None:
+                return True, None, reset
+            if self.window_count >= self.rate_limit:
+                return False, 0, reset
+            self.window_count += 1
+            return True, self.rate_limit - self.window_count, reset
+
+    def task(self, task_id):
+        for task in self.account['tasks']:
+            if task['id'] == task_id:
+                return task
+        return None
+
+
+def js_date(epoch):
+    """Format like JavaScript's Date.toString(), as Habitica does."""
+    return time.strftime('%a %b %d %Y %H:%M:%S GMT+0000 (Coordinated Universal Time)',
+                         time.gmtime(epoch))
+
+
+def only_fields(user, fields):
+    """Apply a userFields=a.b,c query: keep the listed top-level keys."""
+    if not fields:
+        return user
+    keep = set(field.split('.')[0] for field in fields.split(','))
+    return dict((key, value) for key, value in user.items()
+                if key in keep or key in ('_id', '_v'))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send headers and body in one go: written separately, they trip the
+    # client's delayed ACK and add ~40ms to every keep-alive request
+    wbufsize = 64 * 1024
+    state = None  # set by make_server
+
+    # (method, route template, handler name), matched in order
+    ROUTES = [
+        ('GET', '/status', 'get_status'),
+        ('GET', '/user', 'get_user'),
+        ('GET', '/groups/party', 'get_party'),
+        ('GET', '/content', 'get_content'),
+        ('GET', '/tasks/user', 'get_tasks'),
+        ('GET', '/tags', 'get_tags'),
+        ('POST', '/tasks/user', 'create_task'),
+        ('POST', '/tasks/:id/score/:direction', 'score_task'),
+        ('PUT', '/tasks/:id/score', 'update_task'),
+        ('PUT', '/tasks/:id', 'update_task'),
+        ('POST', '/tasks/:id/checklist', 'add_checklist_item'),
+        ('POST', '/tasks/:id/checklist/:cid/score', 'score_checklist_item'),
+        ('POST', '/user/feed/:pet/:food', 'feed'),
+        ('POST', '/user/hatch/:egg/:potion', 'hatch'),
+        ('POST', '/user/sleep', 'sleep'),
+    ]
+    COMPILED = [(method, template,
+                 re.compile('^/api/v3%s$' % re.sub(r':(\w+)', r'(?P<\1>[^/]+)',
+                                                   template)),
+                 name)
+                for method, template, name in ROUTES]
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PUT(self):
+        self.dispatch('PUT')
+
+    def dispatch(self, method):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw_body = self.rfile.read(length) if length else b''
+        url = urlparse(self.path)
+        self.query = dict((key, values[0])
+                          for key, values in parse_qs(url.query).items())
+        try:
+            self.body = json.loads(raw_body.decode('utf8')) if raw_body else {}
+        except ValueError:
+            self.body = {}
+
+        state = self.state
+        if state.latency:
+            time.sleep(state.latency)
+        route, handler, params = 'unknown', None, {}
+        for route_method, template, pattern, name in self.COMPILED:
+            match = pattern.match(url.path)
+            if match and route_method == method:
+                route, handler, params = template, getattr(self, name), match.groupdict()
+                break
+
+        allowed, remaining, reset = state.take_rate_limit()
+        headers = {}
+        if remaining is not None:
+            headers.update({'X-RateLimit-Limit': str(state.rate_limit),
+                            'X-RateLimit-Remaining': str(remaining),
+                            'X-RateLimit-Reset': js_date(reset)})
+        if not allowed:
+            headers['Retry-After'] = str(max(1, int(reset - time.time())))
+            status, body = 429, {'success': False, 'error': 'TooManyRequests'}
+        elif handler is None:
+            status, body = 404, {'success': False, 'error': 'NotFound'}
+        else:
+            with state.lock:
+                status, body = handler(**params)
+        sent = self.respond(status, body, headers)
+        state.count('%s %s' % (method, route),
+                    len(raw_body) + len(str(self.headers)), sent)
+
+    def respond(self, status, body, headers):
+        etag = None
+        payload = b''
+        if body is not None:
+            if status in (200, 201):
+                body.setdefault('success', True)
+                body.setdefault('appVersion', APP_VERSION)
+            payload = json.dumps(body).encode('utf8')
+            etag = 'W/"%s"' % hashlib.md5(payload).hexdigest()
+        if (status == 200 and self.command == 'GET'
+                and self.headers.get('If-None-Match') == etag):
+            status, payload = 304, b''
+        if payload and self.state.gzip and \
+                'gzip' in self.headers.get('Accept-Encoding', ''):
+            payload = gzip.compress(payload, 5)
+            headers['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Date', formatdate(usegmt=True))
+        if etag:
+            self.send_header('ETag', etag)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+        return len(payload)
+
+    # endpoints: each returns (status, body)
+
+    def get_status(self):
+        return 200, {'data': {'status': 'up'}}
+
+    def get_user(self):
+        return 200, {'data': only_fields(self.state.account['user'],
+                                         self.query.get('userFields'))}
+
+    def get_party(self):
+        return 200, {'data': self.state.account['party']}
+
+    def get_content(self):
+        return 200, {'data': self.state.account['content']}
+
+    def get_tags(self):
+        return 200, {'data': self.state.account['tags']}
+
+    def get_tasks(self):
+        task_type = self.query.get('type')
+        tasks = self.state.account['tasks']
+        if task_type == 'completedTodos':
+            tasks = [t for t in tasks if t['type'] == 'todo' and t['completed']]
+        elif task_type in TASK_TYPES:
+            tasks = [t for t in tasks if t['type'] == TASK_TYPES[task_type]
+                     and not (task_type == 'todos' and t['completed'])]
+        elif task_type:
+            return 400, {'success': False, 'error': 'BadRequest'}
+        return 200, {'data': tasks}
+
+    def create_task(self):
+        # like Habitica, a list creates several tasks and returns a list
+        bodies = self.body if isinstance(self.body, list) else [self.body]
+        created = []
+        for body in bodies:
+            task = dict({'tags': [], 'notes': '', 'value': 0, 'checklist': [],
+                         'history': [], 'completed': False}, **body)
+            task['id'] = '%08x-0000-4000-8000-new' % len(self.state.account['tasks'])
+            task['checklist'] = [dict(item, id='cl-new-%d' % j)
+                                 for j, item in enumerate(task['checklist'])]
+            self.state.account['tasks'].insert(0, task)
+            created.append(task)
+        self.state.account['user']['_v'] += 1
+        # 201 Created, as Habitica answers
+        return 201, {'data': created if isinstance(self.body, list)
+                     else created[0]}
+
+    def score_task(self, id, direction):
+        task = self.state.task(id)
+        if task is None:
+            return 404, {'success': False, 'error': 'NotFound'}
+        delta = 1.0 if direction == 'up' else -1.0
+        task['value'] += delta
+        if task['type'] in ('daily', 'todo') and direction == 'up':
+            task['completed'] = True
+        user = self.state.account['user']
+        user['_v'] += 1
+        user['stats']['exp'] += 10 if direction == 'up' else 0
+        return 200, {'data': dict(user['stats'], delta=delta)}
+
+    def update_task(self, id):
+        task = self.state.task(id)
+        if task is None:
+            return 404, {'success': False, 'error': 'NotFound'}
+        task.update(self.body)
+        self.state.account['user']['_v'] += 1
+        return 200, {'data': task}
+
+    def add_checklist_item(self, id):
+        task = self.state.task(id)
+        if task is None:
+            return 404, {'success': False, 'error': 'NotFound'}
+        task['checklist'].append({'id': 'cl-new-%d' % len(task['checklist']),
+                                  'text': self.body.get('text', ''),
+                                  'completed': False})
+        return 200, {'data': task}
+
+    def score_checklist_item(self, id, cid):
+        task = self.state.task(id)
+        for item in (task or {}).get('checklist', ()):
+            if item['id'] == cid:
+                item['completed'] = not item['completed']
+                return 200, {'data': task}
+        return 404, {'success': False, 'error': 'NotFound'}
+
+    def feed(self, pet, food):
+        items = self.state.account['user']['items']
+        amount = int(self.query.get('amount', 1))
+        if items['food'].get(food, 0) < amount or pet not in items['pets']:
+            return 404, {'success': False, 'error': 'NotFound'}
+        target = self.state.account['content']['food'][food]['target']
+        points = 5 if pet.endswith('-' + target) else 2
+        items['food'][food] -= amount
+        items['pets'][pet] = min(items['pets'][pet] + points * amount, 50)
+        self.state.account['user']['_v'] += 1
+        return 200, {'data': items['pets'][pet],
+                     'message': '%s really likes the %s!' % (pet, food)}
+
+    def hatch(self, egg, potion):
+        items = self.state.account['user']['items']
+        if items['eggs'].get(egg, 0) < 1 or \
+                items['hatchingPotions'].get(potion, 0) < 1:
+            return 404, {'success': False, 'error': 'NotFound'}
+        items['eggs'][egg] -= 1
+        items['hatchingPotions'][potion] -= 1
+        items['pets']['%s-%s' % (egg, potion)] = 5
+        self.state.account['user']['_v'] += 1
+        return 200, {'data': items, 'message': 'Your egg hatched!'}
+
+    def sleep(self):
+        preferences = self.state.account['user']['preferences']
+        preferences['sleep'] = not preferences['sleep']
+        self.state.account['user']['_v'] += 1
+        return 200, {'data': preferences['sleep']}
+
+
+def make_server(port=0, **options):
+    """A ThreadingHTTPServer for a fresh MockState(**options), on `port`."""
+    state = MockState(**options)
+    handler = type('BoundHandler', (Handler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def start(port=0, **options):
+    """Serve in a background thread; returns the server (see .state)."""
+    server = make_server(port, **options)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def main(argv):
+    opts = {'--port': '8765', '--tasks': '100', '--history': '30',
+            '--content': '50', '--latency': '0', '--rate-limit': None}
+    for arg in argv:
+        if arg == '--no-gzip':
+            opts[arg] = True
+        elif arg.startswith('--') and '=' in arg:
+            key, value = arg.split('=', 1)
+            opts[key] = value
+    server = make_server(int(opts['--port']),
+                         tasks=int(opts['--tasks']),
+                         history=int(opts['--history']),
+                         content=int(opts['--content']),
+                         latency=float(opts['--latency']) / 1000,
+                         rate_limit=(int(opts['--rate-limit'])
+                                     if opts['--rate-limit'] else None),
+                         gzip=not opts.get('--no-gzip'))
+    print('mock habitica on http://127.0.0.1:%d' % server.server_port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.state.stats(), indent=2, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Routing benchmark: cost of turning an endpoint call into a URI.
+
+Times the client-side work of a request, short of sending it: looking
+up the endpoint (``hbt.tasks.score``), picking its route and building
+the URI, for the calls batch commands make by the thousand. The
+attribute-chain resolution the client used before the route table
+(`LegacyEndpoint`, a new object per attribute access and the URI
+rebuilt with string formatting on every call) is timed alongside.
+
+    python benchmarks/routes.py
+    python benchmarks/routes.py --calls=100000
+
+Usage: routes.py [--calls=<n>] [--runs=<n>]
+"""
+
+
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUTH = {'url': 'https://habitica.com', 'x-api-user': 'bench',
+        'x-api-key': 'bench'}
+TASK_ID = '0f3c2a9e-1d4b-4c8e-9a7f-2b6d5e8c1a03'
+
+# name -> (endpoint path, kwargs), the calls of todos done, add_cl, pet...
+CALLS = {
+    'score': (('tasks', 'score'), {'_id': TASK_ID, '_direction': 'up',
+                                   '_method': 'post'}),
+    'checklist score': (('tasks', 'checklist', 'score'),
+                        {'_id': TASK_ID, '_cid': TASK_ID, '_method': 'post'}),
+    'feed': (('user', 'feed'), {'_inventory1': 'Wolf-Base',
+                                '_inventory2': 'Meat', '_method': 'post',
+                                '_params': {'amount': 9}}),
+    'list tasks': (('tasks', 'user'), {'type': 'todos'}),
+    'party': (('groups', 'party'), {}),
+}
+
+
+class LegacyEndpoint(object):
+    """The previous endpoint resolution, kept here as the baseline."""
+
+    def __init__(self, auth, resource=None, aspect=None, subaspect=None):
+        self.auth = auth
+        self.resource = resource
+        self.aspect = aspect
+        self.subaspect = subaspect
+
+    def __getattr__(self, m):
+        if m.startswith('__'):
+            raise AttributeError(m)
+        if not self.resource:
+            return LegacyEndpoint(self.auth, resource=m)
+        if not self.aspect:
+            return LegacyEndpoint(self.auth, self.resource, aspect=m)
+        return LegacyEndpoint(self.auth, self.resource, self.aspect, m)
+
+    def prepare(self, kwargs):
+        kwargs.pop('_method', 'get')
+        kwargs.pop('_headers', None)
+        kwargs.pop('_raw', False)
+        kwargs.pop('_stream', False)
+        kwargs.pop('_body', None)
+        kwargs.pop('_params', None)
+        kwargs.pop('_timeout', None)
+        if self.aspect:
+            aspect_id = kwargs.pop('_id', None)
+            subitem_id = kwargs.pop('_cid', None)
+            direction = kwargs.pop('_direction', None)
+            inventory1 = kwargs.pop('_inventory1', None)
+            inventory2 = kwargs.pop('_inventory2', None)
+            if aspect_id is not None:
+                uri = '%s/%s/%s/%s/%s' % (self.auth['url'], 'api/v3',
+                                          self.resource, str(aspect_id),
+                                          self.aspect)
+                if subitem_id is not None:
+                    uri = '%s/%s/%s' % (uri, str(subitem_id), self.subaspect)
+            else:
+                uri = '%s/%s/%s/%s' % (self.auth['url'], 'api/v3',
+                                       self.resource, self.aspect)
+                if inventory1 is not None and inventory2 is not None:
+                    uri = '%s/%s/%s' % (uri, inventory1, inventory2)
+            if direction is not None:
+                uri = '%s/%s' % (uri, direction)
+        else:
+            uri = '%s/%s/%s' % (self.auth['url'], 'api/v3', self.resource)
+        return uri
+
+
+def legacy_call(root, path, kwargs):
+    endpoint = root
+    for name in path:
+        endpoint = getattr(endpoint, name)
+    return endpoint.prepare(dict(kwargs))
+
+
+def routed_call(client, path, kwargs):
+    endpoint = client
+    for name in path:
+        endpoint = getattr(endpoint, name)
+    return client.prepare(endpoint, kwargs)[1]
+
+
+def best(func, root, path, kwargs, calls, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(calls):
+            func(root, path, kwargs)
+        timings.append(time.perf_counter() - start)
+    return min(timings) / calls * 1e6
+
+
+def main(argv):
+    opts = {'--calls': '20000', '--runs': '5'}
+    for arg in argv:
+        key, _, value = arg.partition('=')
+        opts[key] = value
+    calls, runs = int(opts['--calls']), int(opts['--runs'])
+
+    sys.path.insert(0, ROOT)
+    from habitica import api
+
+    legacy = LegacyEndpoint(AUTH)
+    with api.Habitica(auth=dict(AUTH)) as client:
+        print('%-16s %12s %12s %8s' % ('call', 'legacy us', 'routed us',
+                                       'speedup'))
+        for name, (path, kwargs) in sorted(CALLS.items()):
+            assert legacy_call(legacy, path, kwargs) == \
+                routed_call(client, path, kwargs), name
+            before = best(legacy_call, legacy, path, kwargs, calls, runs)
+            after = best(routed_call, client, path, kwargs, calls, runs)
+            print('%-16s %12.2f %12.2f %7.1fx' % (name, before, after,
+                                                  before / after))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Command benchmark: wall time, requests and bytes of CLI commands.
+
+Starts benchmarks/mockserver.py in-process for each account size, runs
+every command as a fresh `bin/habitica` process in a throw-away HOME
+pointed at it, and reports the best wall time together with the number
+of requests and the bytes sent and received. The account is restored
+before every run, so mutating commands (`todos done 1-50`, `pet`) are
+repeatable; local state (snapshots, content store, caches) is wiped
+too unless --warm is given. Unless --rate-limit is set the server sends
+no X-RateLimit headers, so the client paces itself at its default 30
+requests a minute, like it would against habitica.com.
+
+    python benchmarks/run.py
+    python benchmarks/run.py --sizes=10,1000 --latency=100 --warm 'todos done 1-50'
+
+Usage: run.py [--runs=<n>] [--sizes=<n,...>] [--latency=<ms>]
+              [--rate-limit=<n>] [--warm] [--save=<file>] [<command>...]
+"""
+
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mockserver
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'bin', 'habitica')
+COMMANDS = ['server', 'status', 'habits', 'dailies', 'todos',
+            'todos --completed', 'todos done 1-50', 'habits up 1-3', 'pet']
+SIZES = [10, 100, 1000]
+AUTH_CFG = '[Habitica]\nurl = http://127.0.0.1:%d\nlogin = bench\npassword = bench\n'
+
+
+def reset_home(home, port):
+    config = os.path.join(home, '.config', 'habitica')
+    if os.path.isdir(config):
+        shutil.rmtree(config)
+    os.makedirs(config)
+    with open(os.path.join(config, 'auth.cfg'), 'w') as f:
+        f.write(AUTH_CFG % port)
+
+
+def run_command(command, home):
+    """Run one command, answering yes to prompts; returns seconds taken."""
+    env = dict(os.environ, HOME=home, BROWSER='true',
+               PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, SCRIPT] + command.split(), env=env,
+                          cwd=home, input='y\n' * 10, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+    if proc.returncode:
+        sys.stderr.write('%r failed:\n%s' % (command, proc.stderr))
+    return elapsed
+
+
+def benchmark(server, command, home, runs, warm):
+    port = server.server_port
+    reset_home(home, port)
+    if warm:  # fill local caches and snapshots first
+        run_command(command, home)
+    best = None
+    for _ in range(runs):
+        if not warm:
+            reset_home(home, port)
+        server.state.reset()
+        elapsed = run_command(command, home)
+        stats = server.state.stats()
+        if best is None or elapsed < best['wall_ms'] / 1000:
+            best = dict(stats, wall_ms=elapsed * 1000)
+    return best
+
+
+def main(argv):
+    opts = {'--runs': '3', '--sizes': ','.join(map(str, SIZES)),
+            '--latency': '0', '--rate-limit': None, '--save': None}
+    commands = []
+    for arg in argv:
+        if arg == '--warm':
+            opts[arg] = True
+        elif arg.startswith('--') and '=' in arg:
+            key, value = arg.split('=', 1)
+            opts[key] = value
+        else:
+            commands.append(arg)
+    commands = commands or COMMANDS
+
+    results = {}
+    home = tempfile.mkdtemp(prefix='habitica-bench-')
+    try:
+        print('%-20s %6s %10s %6s %10s %12s' % (
+            'command', 'tasks', 'wall ms', 'reqs', 'sent B', 'received B'))
+        for size in [int(size) for size in opts['--sizes'].split(',')]:
+            server = mockserver.start(
+                tasks=size, history=30, content=50,
+                latency=float(opts['--latency']) / 1000,
+                rate_limit=(int(opts['--rate-limit'])
+                            if opts['--rate-limit'] else None))
+            try:
+                for command in commands:
+                    result = benchmark(server, command, home,
+                                       int(opts['--runs']), opts.get('--warm'))
+                    results['%s @ %d' % (command, size)] = result
+                    print('%-20s %6d %10.1f %6d %10d %12d' % (
+                        command, size, result['wall_ms'], result['requests'],
+                        result['bytes_in'], result['bytes_out']))
+            finally:
+                server.shutdown()
+                server.server_close()
+    finally:
+        shutil.rmtree(home)
+
+    if opts['--save']:
+        with open(opts['--save'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Startup benchmark: import time of the habitica CLI, per command.
+
+Runs `bin/habitica <command>` under `python -X importtime` in a
+throw-away HOME whose auth.cfg points at a closed local port, so nothing
+touches a real account (network commands fail right after their imports,
+which is all we measure). Results can be saved and compared against a
+previous run to catch regressions:
+
+    python benchmarks/startup.py --save=baseline.json
+    python benchmarks/startup.py --baseline=baseline.json
+
+Usage: startup.py [--runs=<n>] [--save=<file>] [--baseline=<file>]
+                  [--tolerance=<pct>] [<command>...]
+"""
+
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, 'bin', 'habitica')
+COMMANDS = ['--version', '--help', 'home', 'server', 'status', 'habits',
+            'dailies', 'todos']
+AUTH_CFG = '[Habitica]\nurl = http://127.0.0.1:9\nlogin = bench\npassword = bench\n'
+
+
+def import_time(command, home):
+    """Return (total import microseconds, number of modules) for one run."""
+    env = dict(os.environ, HOME=home, BROWSER='true',
+               PYTHONPATH=os.pathsep.join([ROOT, os.environ.get('PYTHONPATH', '')]))
+    proc = subprocess.run([sys.executable, '-X', 'importtime', SCRIPT]
+                          + command.split(), env=env, cwd=home,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                          universal_newlines=True)
+    total = modules = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        total += int(line.split(':', 1)[1].split('|')[0])
+        modules += 1
+    return total, modules
+
+
+def main(argv):
+    opts = {'--runs': '5', '--save': None, '--baseline': None,
+            '--tolerance': '20'}
+    commands = []
+    for arg in argv:
+        if arg.startswith('--') and '=' in arg:
+            key, value = arg.split('=', 1)
+            if key not in opts:
+                sys.exit('unknown option %s' % key)
+            opts[key] = value
+        elif arg in opts:
+            # `--save file` would benchmark `--save` and `file` as commands
+            sys.exit('%s needs a value: %s=<...>' % (arg, arg))
+        else:
+            commands.append(arg)
+    commands = commands or COMMANDS
+
+    home = tempfile.mkdtemp(prefix='habitica-bench-')
+    try:
+        os.makedirs(os.path.join(home, '.config', 'habitica'))
+        with open(os.path.join(home, '.config', 'habitica', 'auth.cfg'), 'w') as f:
+            f.write(AUTH_CFG)
+        results = {}
+        for command in commands:
+            runs = [import_time(command, home) for _ in range(int(opts['--runs']))]
+            results[command] = {'import_ms': min(r[0] for r in runs) / 1000.0,
+                                'modules': runs[0][1]}
+    finally:
+        shutil.rmtree(home)
+
+    baseline = {}
+    if opts['--baseline']:
+        with open(opts['--baseline']) as f:
+            baseline = json.load(f)
+    tolerance = 1 + float(opts['--tolerance']) / 100
+    regressions = []
+    print('%-12s %10s %8s %10s' % ('command', 'import ms', 'modules', 'baseline'))
+    for command, result in results.items():
+        before = baseline.get(command, {}).get('import_ms')
+        flag = ''
+        if before is not None and result['import_ms'] > before * tolerance:
+            regressions.append(command)
+            flag = '  REGRESSION'
+        print('%-12s %10.1f %8d %10s%s' % (
+            command, result['import_ms'], result['modules'],
+            '%.1f' % before if before is not None else '-', flag))
+
+    if opts['--save']:
+        with open(opts['--save'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
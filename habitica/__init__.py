@@ -1 +1,5 @@
-from .feeder import rssreader
+def cli(*args, **kwargs):
+    # imported on call, so `import habitica` (e.g. by bin/habitica before it
+    # tries the daemon) stays cheap
+    from .core import cli
+    return cli(*args, **kwargs)
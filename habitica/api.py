@@ -9,86 +9,466 @@ http://github.com/philadams/habitica
 """
 
 
-import json
+import calendar
+from email.utils import parsedate_tz, mktime_tz
+import random
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from . import codec, routes
 
 API_URI_BASE = 'api/v3'
+STATUS_ROUTE = '/status'
 API_CONTENT_TYPE = 'application/json'
+API_POOL_SIZE = 10  # max keep-alive connections kept open per host
+API_TIMEOUT = (5, 30)  # (connect, read) seconds
+API_RATE_LIMIT = 30  # requests per window, until the server tells us otherwise
+API_RATE_WINDOW = 60  # seconds
+API_MAX_RETRIES = 3
+API_BACKOFF_BASE = 0.5  # seconds, doubled on every retry
+API_BACKOFF_MAX = 30  # seconds, also caps honored Retry-After values
+API_RETRY_STATUSES = (429, 502, 503, 504)
+API_BREAKER_THRESHOLD = 5  # consecutive failures before failing fast
+API_BREAKER_COOLDOWN = 30  # seconds before asking /status again
+
+
+def decode(res):
+    """The JSON body of a response, noting the time taken when traced."""
+    trace = getattr(res, 'trace', None)
+    if trace is None:
+        return codec.decode_response(res)
+    start = time.perf_counter()
+    body = codec.decode_response(res)
+    trace['decode'] = time.perf_counter() - start
+    return body
+
+
+def iter_data(res):
+    """Yield the items of a streamed response's "data" list."""
+    from .stream import STREAM_CHUNK_SIZE, iter_json_items
+
+    trace = getattr(res, 'trace', None)
+    if trace is not None:
+        start = time.perf_counter()
+    try:
+        for item in iter_json_items(res.iter_content(STREAM_CHUNK_SIZE)):
+            yield item
+    finally:
+        if trace is not None:
+            # downloading and decoding overlap, count both as transfer
+            trace['transfer'] = time.perf_counter() - start
+            trace['bytes'] = res.raw.tell()
+        res.close()
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised without sending anything while the server is known down."""
+
+
+def new_session(pool_size=API_POOL_SIZE, keep_alive=True, timed=False):
+    """
+    Build a requests session backed by a keep-alive connection pool.
+    With `timed`, connections report their setup times to instrument.
+    """
+    adapter_class = HTTPAdapter
+    if timed:
+        from .instrument import TimedAdapter as adapter_class
+    session = requests.Session()
+    adapter = adapter_class(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    session.headers['Accept-Encoding'] = codec.accept_encoding()
+    return session
+
+
+def parse_rate_limit_reset(value, now=None):
+    """
+    Turn an X-RateLimit-Reset header into an epoch timestamp.
+
+    Habitica sends a JavaScript date string, e.g.
+    'Thu Oct 17 2026 10:00:00 GMT+0000 (Coordinated Universal Time)';
+    plain epoch seconds/milliseconds and delta seconds are accepted too.
+    Returns None when the value can't be understood.
+    """
+    now = time.time() if now is None else now
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        pass
+    else:
+        if number > 1e12:
+            return number / 1000.0
+        if number > 1e9:
+            return number
+        return now + number
+    try:
+        bits = value.split()
+        stamp = time.strptime(' '.join(bits[:5]), '%a %b %d %Y %H:%M:%S')
+        offset = 0
+        if len(bits) > 5 and bits[5].startswith('GMT') and len(bits[5]) == 8:
+            sign = -1 if bits[5][3] == '-' else 1
+            offset = sign * (int(bits[5][4:6]) * 3600 + int(bits[5][6:8]) * 60)
+        return calendar.timegm(stamp) - offset
+    except (AttributeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before retry number `attempt` (1-based): the server's
+    Retry-After (seconds or HTTP date) if given, else exponential backoff
+    with full jitter. Never more than API_BACKOFF_MAX.
+    """
+    if retry_after:
+        try:
+            delay = float(retry_after)
+        except ValueError:
+            parsed = parsedate_tz(retry_after)
+            delay = mktime_tz(parsed) - time.time() if parsed else None
+        if delay is not None:
+            return min(max(delay, 0), API_BACKOFF_MAX)
+    return random.uniform(0, min(API_BACKOFF_MAX,
+                                 API_BACKOFF_BASE * 2 ** attempt))
+
+
+def never_sent(error):
+    """True when a connection error happened before the request left."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def query_params(kwargs):
+    """
+    Encode GET kwargs; lists become comma-separated values, which is how
+    Habitica expects e.g. `userFields=['stats', 'items.pets']`.
+    """
+    return dict((k, ','.join(v) if isinstance(v, (list, tuple)) else v)
+                for k, v in kwargs.items())
+
+
+class RateLimiter(object):
+    """
+    Thread-safe token bucket throttling requests of one client.
+
+    The bucket starts full and refills steadily; once the server reports
+    X-RateLimit-Remaining/Reset it becomes authoritative: the bucket never
+    holds more than the server says is left and refills at the reset time.
+    """
+
+    def __init__(self, capacity=API_RATE_LIMIT, window=API_RATE_WINDOW):
+        self.capacity = capacity
+        self.window = float(window)
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.reset_at = None
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        if self.reset_at is not None:
+            if now >= self.reset_at:
+                self.tokens = float(self.capacity)
+                self.reset_at = None
+        else:
+            rate = self.capacity / self.window
+            self.tokens = min(self.capacity,
+                              self.tokens + (now - self.updated) * rate)
+        self.updated = now
+
+    def acquire(self):
+        """Block until a request may be sent, then consume a token."""
+        while True:
+            with self.lock:
+                now = time.time()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if self.reset_at is not None:
+                    wait = self.reset_at - now
+                else:
+                    wait = (1 - self.tokens) * self.window / self.capacity
+            time.sleep(max(wait, 0.01))
+
+    def update(self, headers):
+        """Sync the bucket with the X-RateLimit-* headers of a response."""
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is None:
+            return
+        with self.lock:
+            limit = headers.get('X-RateLimit-Limit')
+            if limit is not None:
+                self.capacity = max(int(limit), 1)
+            self.tokens = min(self.tokens, float(remaining))
+            reset_at = parse_rate_limit_reset(headers.get('X-RateLimit-Reset'))
+            if reset_at is not None:
+                self.reset_at = reset_at
+
+
+class CircuitBreaker(object):
+    """
+    Fails requests fast while the server looks down.
+
+    After `threshold` consecutive failures the circuit opens and requests
+    raise CircuitOpenError. Once `cooldown` has passed, the next request
+    first asks /status - the same up/down signal the `server` command
+    shows - and goes through only if the server reports itself up.
+    """
+
+    def __init__(self, threshold=API_BREAKER_THRESHOLD,
+                 cooldown=API_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def before_request(self, server_is_up):
+        """Raise CircuitOpenError unless a request may be sent now."""
+        with self.lock:
+            if self.opened_at is None:
+                return
+            if time.time() - self.opened_at < self.cooldown:
+                raise CircuitOpenError('Habitica server is down, not retrying '
+                                       'for another %ds' % (self.cooldown -
+                                       (time.time() - self.opened_at)))
+        up = server_is_up()
+        self.observe_status(up)
+        if not up:
+            raise CircuitOpenError('Habitica server is still down')
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = time.time()
+
+    def observe_status(self, up):
+        """Take an answer of /status into account."""
+        if up:
+            self.record_success()
+        else:
+            with self.lock:
+                self.failures = max(self.failures, self.threshold)
+                self.opened_at = time.time()
+
+
+class Endpoint(object):
+    """
+    One endpoint of a client, e.g. ``hbt.tasks.score``, with its routes
+    (see routes.py). Calling it sends a request, see Habitica.request.
+
+    Endpoints are created on first use and stored as attributes of their
+    parent, so ``hbt.tasks.score`` is two plain attribute reads from then
+    on.
+    """
+
+    __slots__ = ('client', 'path', 'routes', '__dict__')
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.routes = routes.lookup(path)
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        child = Endpoint(self.client, self.path + (name,))
+        setattr(self, name, child)
+        return child
+
+    def __repr__(self):
+        return '<Endpoint %s>' % '.'.join(self.path)
+
+    @property
+    def auth(self):
+        return self.client.auth
+
+    def __call__(self, **kwargs):
+        return self.client.request(self, kwargs)
 
 
 class Habitica(object):
     """
     A minimalist Habitica API class.
+
+    All endpoints of one client (``hbt.tasks.user`` and friends) share
+    its connection pool, so repeated calls reuse open connections, its
+    rate limiter, so concurrent callers stay within the server's quota,
+    and its circuit breaker. Failed requests are retried with backoff
+    (non-GET requests only when the server can't have acted on them).
+    Call ``close()`` (or use the client as a context manager) when done.
+
+    Pass an instrument.Recorder as `recorder` to trace every request.
     """
 
-    def __init__(self, auth=None, resource=None, aspect=None, subaspect=None):
+    def __init__(self, auth=None, session=None, timeout=API_TIMEOUT,
+                 pool_size=API_POOL_SIZE, keep_alive=True, limiter=None,
+                 breaker=None, max_retries=API_MAX_RETRIES, recorder=None):
         self.auth = auth
-        self.resource = resource
-        self.aspect = aspect
-        self.subaspect = subaspect
         self.headers = auth if auth else {}
         self.headers.update({'content-type': API_CONTENT_TYPE})
+        self.base_uri = '%s/%s' % (auth['url'], API_URI_BASE) if auth else None
+        self.timeout = timeout
+        if session is None:
+            session = new_session(pool_size=pool_size, keep_alive=keep_alive,
+                                  timed=recorder is not None)
+        self.session = session
+        self.limiter = limiter if limiter is not None else RateLimiter()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.max_retries = max_retries
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        child = Endpoint(self, (name,))
+        setattr(self, name, child)
+        return child
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
-    def __getattr__(self, m):
+    def close(self):
+        """Close every pooled connection of this client."""
+        self.session.close()
+
+    def _server_is_up(self):
+        """Ask /status directly, bypassing retries and the breaker."""
         try:
-            return object.__getattr__(self, m)
-        except AttributeError:
-            if not self.resource:
-                return Habitica(auth=self.auth, resource=m)
+            res = self.session.get('%s/%s/status' % (self.auth['url'],
+                                                     API_URI_BASE),
+                                   headers=self.headers, timeout=self.timeout)
+            return res.ok and codec.decode_response(res)['data']['status'] == 'up'
+        except (requests.RequestException, ValueError, KeyError):
+            return False
 
-            else:
-                if not self.aspect:
-                    return Habitica(auth=self.auth, resource=self.resource,
-                                aspect=m)
-                else:
-                    return Habitica(auth=self.auth, resource=self.resource,
-                     aspect=self.aspect, subaspect=m)
+    def _send(self, method, uri, timeout, route=None, **request_kwargs):
+        """Send one request, retrying with backoff and minding the breaker."""
+        if route != STATUS_ROUTE:  # /status is how the breaker recovers
+            self.breaker.before_request(self._server_is_up)
+        recorder = self.recorder
+        attempt = 0
+        while True:
+            if recorder is not None:
+                queued = time.perf_counter()
+            self.limiter.acquire()
+            if recorder is not None:
+                started = recorder.start(queued)
+            try:
+                res = self.session.request(method, uri, timeout=timeout,
+                                           **request_kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if recorder is not None:
+                    recorder.finish(started, method, route, type(e).__name__)
+                if attempt < self.max_retries and (method == 'get' or
+                                                   never_sent(e)):
+                    attempt += 1
+                    time.sleep(backoff_delay(attempt))
+                    continue
+                self.breaker.record_failure()
+                raise
+            if recorder is not None:
+                res.trace = recorder.finish(started, method, route,
+                                            res.status_code, res)
+            self.limiter.update(res.headers)
 
-    def __call__(self, **kwargs):
-        method = kwargs.pop('_method', 'get')
-        
-        # build up URL... Habitica's api is the *teeniest* bit annoying
-        # so either i need to find a cleaner way here, or i should
-        # get involved in the API itself and... help it.
-        if self.aspect:
-            aspect_id = kwargs.pop('_id', None)
-            subitem_id = kwargs.pop('_cid', None)
-            direction = kwargs.pop('_direction', None)
-            inventory1 = kwargs.pop('_inventory1', None)
-            inventory2 = kwargs.pop('_inventory2', None)
-            if aspect_id is not None:
-                uri = '%s/%s/%s/%s/%s' % (self.auth['url'],
-                                          API_URI_BASE,
-                                          self.resource,
-                                          str(aspect_id),
-                                          self.aspect)
-                if subitem_id is not None:
-                    uri = '%s/%s/%s' % (uri,str(subitem_id),self.subaspect)
+            # only retry writes the server refused outright
+            retryable = (API_RETRY_STATUSES if method == 'get'
+                         else (429, 503))
+            if res.status_code in retryable and attempt < self.max_retries:
+                attempt += 1
+                time.sleep(backoff_delay(attempt,
+                                         res.headers.get('Retry-After')))
+                continue
+            if res.status_code >= 500:
+                self.breaker.record_failure()
             else:
-                uri = '%s/%s/%s/%s' % (self.auth['url'],
-                                       API_URI_BASE,
-                                       self.resource,
-                                       self.aspect)
-                if inventory1 is not None and inventory2 is not None:
-                  uri = '%s/%s/%s' % (uri, inventory1, inventory2) 
-            if direction is not None:
-                uri = '%s/%s' % (uri, direction)
+                self.breaker.record_success()
+            return res
+
+    def prepare(self, endpoint, kwargs):
+        """
+        Resolve a call of `endpoint`: returns its routes.Route, the URI and
+        the fields (the kwargs not starting with `_`).
+        """
+        for route in endpoint.routes:
+            if route.matches(kwargs):
+                break
         else:
-            uri = '%s/%s/%s' % (self.auth['url'],
-                                API_URI_BASE,
-                                self.resource)
-        
+            raise TypeError('%s needs %s' % ('.'.join(endpoint.path),
+                                             ', '.join(route.kwargs)))
+        fields = {key: value for key, value in kwargs.items()
+                  if key[:1] != '_'}
+        return route, self.base_uri + route.build(kwargs), fields
+
+    def request(self, endpoint, kwargs):
+        """
+        Send a request to `endpoint` and return the decoded JSON body.
+
+        Keyword arguments starting with `_` are options, the rest make up
+        the query (GET) or the JSON body (PUT, POST). The route's URI
+        parameters come from options named after them, e.g. `_id` and
+        `_direction` for /tasks/:id/score/:direction. `_method` is the
+        HTTP method (default: get), `_headers` adds request headers,
+        `_timeout` overrides the (connect, read) timeout and `_raw=True`
+        returns the requests.Response itself, which also lets callers see
+        a 304 Not Modified answer. `_stream=True` doesn't read the body up
+        front: it returns an iterator over the items of the response's
+        "data" list, decoded as they arrive (or, with `_raw`, the unread
+        Response). `_body` gives the JSON body (e.g. a list) explicitly;
+        `_params` adds query parameters to a PUT or POST.
+        """
+        route, uri, fields = self.prepare(endpoint, kwargs)
+        method = kwargs.get('_method', 'get')
+        extra_headers = kwargs.get('_headers')
+        stream = kwargs.get('_stream', False)
+        json_body = kwargs.get('_body')
+        timeout = kwargs.get('_timeout', self.timeout)
+
+        headers = self.headers
+        if extra_headers:
+            headers = dict(self.headers, **extra_headers)
+
         # actually make the request of the API
         if method in ['put', 'post']:
-            res = getattr(requests, method)(uri, headers=self.headers,
-                                            data=json.dumps(kwargs))
+            res = self._send(method, uri, timeout, route.template,
+                             headers=headers,
+                             params=query_params(kwargs.get('_params') or {}),
+                             data=codec.dumps(fields if json_body is None
+                                              else json_body))
         else:
-            res = getattr(requests, method)(uri, headers=self.headers,
-                                            params=kwargs)
+            res = self._send(method, uri, timeout, route.template,
+                             headers=headers, params=query_params(fields),
+                             stream=stream)
 
         # print(res.url)  # debug...
-        if res.status_code == requests.codes.ok:
-            return res.json()
+        # creating a task answers 201 Created: any 2xx is a success
+        succeeded = 200 <= res.status_code < 300
+        if kwargs.get('_raw') and (
+                succeeded or res.status_code == requests.codes.not_modified):
+            return res
+        if stream and succeeded:
+            return iter_data(res)
+        if succeeded:
+            body = decode(res) if res.content else {}
+            if route.template == STATUS_ROUTE:
+                self.breaker.observe_status(body['data']['status'] == 'up')
+            return body
         else:
             res.raise_for_status()
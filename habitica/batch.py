@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Concurrent execution of independent Habitica requests.
+
+Throttling is left to the client's api.RateLimiter, so callers only pick
+how many requests may be in flight at once.
+"""
+
+
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+BATCH_WORKERS = 4  # concurrent requests in flight per batch
+
+Outcome = namedtuple('Outcome', ['item', 'result', 'error'])
+
+
+def _attempt(func, item):
+    try:
+        return Outcome(item, func(item), None)
+    except Exception as e:
+        logging.debug('Batch item %r failed: %s' % (item, e))
+        return Outcome(item, None, e)
+
+
+def run_batch(func, items, workers=BATCH_WORKERS):
+    """
+    Call `func(item)` for every item concurrently.
+
+    Returns one Outcome per item, in the order of `items`. An exception
+    raised for one item is stored in its Outcome.error instead of
+    aborting the rest of the batch.
+    """
+    items = list(items)
+    if len(items) <= 1:
+        return [_attempt(func, item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(lambda item: _attempt(func, item), items))
+
+
+def run_stream(func, items, workers=BATCH_WORKERS):
+    """
+    Like run_batch, but yield the Outcomes (still in order) as they are
+    ready, pulling from `items` lazily: no more than twice `workers`
+    items are taken before their outcomes have been consumed.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for item in items:
+            pending.append(pool.submit(_attempt, func, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def fan_out(*calls, **kwargs):
+    """
+    Run independent zero-argument `calls` in parallel and return their
+    results in call order, e.g.
+
+        user, party = fan_out(hbt.user, hbt.groups.party)
+
+    Unlike run_batch, a failure is not collected: once every call has
+    finished, the first exception (in call order) is re-raised.
+    """
+    workers = kwargs.get('workers', len(calls))
+    outcomes = run_batch(lambda call: call(), calls, workers=workers)
+    for outcome in outcomes:
+        if outcome.error is not None:
+            raise outcome.error
+    return [outcome.result for outcome in outcomes]
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Bulk export and import of tasks.
+
+Exports stream tasks from the server straight into NDJSON (one task
+per line) or CSV, written in chunks. Imports read such a file lazily
+and create its tasks, checklists included, with array POSTs to
+/tasks/user of IMPORT_BATCH tasks each, a few batches in flight at
+once. Finished batches are noted in a progress file next to the input,
+so an interrupted import picks up where it stopped when rerun.
+"""
+
+
+import csv
+import io
+import json
+import logging
+import os
+
+EXPORT_FIELDS = ('id', 'type', 'text', 'notes', 'priority', 'date',
+                 'completed', 'value', 'checklist')
+EXPORT_CHUNK = 500  # tasks per write
+IMPORT_BATCH = 50  # tasks per POST
+IMPORT_WORKERS = 2  # POSTs in flight
+IMPORT_TYPES = ('habit', 'daily', 'todo', 'reward')
+
+
+def file_format(path):
+    """'csv' for *.csv files, 'ndjson' for anything else."""
+    return 'csv' if path.lower().endswith('.csv') else 'ndjson'
+
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` consecutive items of `iterable`."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def export_row(task):
+    """The EXPORT_FIELDS of a task dict, checklist items as text only."""
+    row = dict((field, task.get(field)) for field in EXPORT_FIELDS)
+    row['checklist'] = [{'text': item.get('text', ''),
+                         'completed': item.get('completed', False)}
+                        for item in task.get('checklist') or ()]
+    return row
+
+
+def export_tasks(tasks, f, fmt='ndjson'):
+    """
+    Write task dicts to the text file `f` as NDJSON or CSV, EXPORT_CHUNK
+    tasks at a time. Returns the number of tasks written.
+    """
+    count = 0
+    if fmt == 'csv':
+        f.write(','.join(EXPORT_FIELDS) + '\r\n')
+    for chunk in chunked(tasks, EXPORT_CHUNK):
+        rows = [export_row(task) for task in chunk]
+        if fmt == 'csv':
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, EXPORT_FIELDS)
+            for row in rows:
+                row['checklist'] = json.dumps(row['checklist'])
+                writer.writerow(row)
+            f.write(buf.getvalue())
+        else:
+            f.write(''.join(json.dumps(row) + '\n' for row in rows))
+        count += len(chunk)
+    return count
+
+
+def read_records(f, fmt='ndjson'):
+    """Yield the task records of an NDJSON or CSV export, one at a time."""
+    if fmt == 'csv':
+        for record in csv.DictReader(f):
+            yield record
+        return
+    for number, line in enumerate(f, 1):
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as e:
+                raise ValueError('line %d: %s' % (number, e))
+
+
+def import_payload(record):
+    """
+    The /tasks/user body creating the task of an export record; CSV
+    fields arrive as strings. Ids and scores are left to the server.
+    """
+    task_type = record.get('type') or 'todo'
+    if task_type not in IMPORT_TYPES:
+        raise ValueError('cannot import a task of type %r' % task_type)
+    payload = {'type': task_type, 'text': record.get('text') or ''}
+    if record.get('notes'):
+        payload['notes'] = record['notes']
+    if record.get('priority') not in (None, ''):
+        payload['priority'] = float(record['priority'])
+    if record.get('date') not in (None, '', 'None'):
+        payload['date'] = record['date']
+    checklist = record.get('checklist')
+    if isinstance(checklist, str):
+        checklist = json.loads(checklist) if checklist else []
+    if checklist:
+        payload['checklist'] = [
+            {'text': item['text'],
+             'completed': item.get('completed') in (True, 'True', 'true')}
+            for item in checklist]
+    return payload
+
+
+class ImportProgress(object):
+    """
+    The batches of one input file already imported, kept as JSON lines
+    in `path`: a header with the batch size, then one line per batch.
+    """
+
+    def __init__(self, path, batch_size):
+        self.path = path
+        self.batch_size = batch_size
+        self.done = set()
+        if not os.path.exists(path):
+            self._append({'batch_size': batch_size})
+            return
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:  # torn write at the end of the file
+                    continue
+                if 'batch_size' in record and record['batch_size'] != batch_size:
+                    raise ValueError('%s was written for batches of %d tasks'
+                                     % (path, record['batch_size']))
+                if 'batch' in record:
+                    self.done.add(record['batch'])
+
+    def _append(self, record):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def mark(self, batch, created):
+        self.done.add(batch)
+        self._append({'batch': batch, 'created': created})
+
+
+def import_tasks(hbt, path, batch_size=IMPORT_BATCH, workers=IMPORT_WORKERS):
+    """
+    Create the tasks exported to `path`. Returns the number of tasks
+    created, skipped (imported by an earlier run) and failed.
+    """
+    from . import batch
+
+    progress = ImportProgress(path + '.progress', batch_size)
+    created = skipped = failed = 0
+
+    def pending(batches):
+        nonlocal skipped
+        for index, records in batches:
+            if index in progress.done:
+                skipped += len(records)
+                continue
+            yield index, [import_payload(record) for record in records]
+
+    def post(item):
+        index, payloads = item
+        return hbt.tasks.user(_method='post', _body=payloads)
+
+    with open(path, newline='') as f:
+        batches = enumerate(chunked(read_records(f, file_format(path)),
+                                    batch_size))
+        for outcome in batch.run_stream(post, pending(batches), workers):
+            index, payloads = outcome.item
+            if outcome.error is not None:
+                failed += len(payloads)
+                logging.error('Batch %d (tasks %d-%d) failed: %s'
+                              % (index + 1, index * batch_size + 1,
+                                 index * batch_size + len(payloads),
+                                 outcome.error))
+                continue
+            progress.mark(index, len(payloads))
+            created += len(payloads)
+            logging.info('Imported batch %d (%d tasks so far)'
+                         % (index + 1, created))
+    return created, skipped, failed
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Small key/value cache kept in a single SQLite file.
+
+Keys live in namespaces (e.g. 'Quest'), values are stored as JSON, and
+entries can expire after a per-entry TTL. The cache holds at most
+`max_entries` entries and evicts the least recently used ones first.
+Writes run in IMMEDIATE transactions, so several habitica processes can
+share the file safely. Reads don't write: an entry's access time is only
+refreshed once it is CACHE_TOUCH_INTERVAL old, so LRU order is kept to
+that precision and a warm cache is read without taking the write lock.
+"""
+
+
+import json
+import logging
+import os
+import sqlite3
+import time
+
+CACHE_MAX_ENTRIES = 1000
+CACHE_BUSY_TIMEOUT = 10  # seconds to wait for another process' transaction
+CACHE_TOUCH_INTERVAL = 3600  # seconds; precision of the LRU access times
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+"""
+
+
+class Cache(object):
+    """
+    SQLite-backed cache with namespaces, TTLs and LRU eviction.
+
+        cache = Cache(path)
+        cache.set('Quest', 'quest_key', 'vice1')
+        cache.get('Quest', 'quest_key', '')
+
+    `hits` and `misses` count the lookups made through this instance.
+    """
+
+    def __init__(self, path, max_entries=CACHE_MAX_ENTRIES):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path, timeout=CACHE_BUSY_TIMEOUT,
+                                  isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def _transaction(self, statements):
+        """Run `statements` ((sql, params) pairs) as one atomic write."""
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                cursor.execute(sql, params)
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    def get(self, namespace, key, default=None):
+        """Return the cached value, or `default` if missing or expired."""
+        now = time.time()
+        row = self.db.execute(
+            'SELECT value, expires, accessed FROM entries '
+            'WHERE namespace=? AND key=?', (namespace, key)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            self.misses += 1
+            if row is not None:
+                self.delete(namespace, key)
+            return default
+        self.hits += 1
+        if now - row[2] >= CACHE_TOUCH_INTERVAL:
+            self.db.execute(
+                'UPDATE entries SET accessed=? WHERE namespace=? AND key=?',
+                (now, namespace, key))
+        return json.loads(row[0])
+
+    def set(self, namespace, key, value, ttl=None):
+        """Store `value`; it expires after `ttl` seconds if given."""
+        self.update(namespace, {key: value}, ttl=ttl)
+
+    def update(self, namespace, values, ttl=None):
+        """Store every key/value pair of `values` in one transaction."""
+        now = time.time()
+        expires = now + ttl if ttl is not None else None
+        statements = [(
+            'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+            (namespace, key, json.dumps(value), expires, now))
+            for key, value in values.items()]
+        statements.append((
+            'DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?',
+            (now,)))
+        statements.append((
+            'DELETE FROM entries WHERE rowid IN (SELECT rowid FROM entries '
+            'ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)))
+        self._transaction(statements)
+
+    def delete(self, namespace, key):
+        self._transaction([(
+            'DELETE FROM entries WHERE namespace=? AND key=?',
+            (namespace, key))])
+
+    def close(self):
+        logging.debug('Cache %s: %d hits, %d misses'
+                      % (self.path, self.hits, self.misses))
+        self.db.close()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Local, indexed copy of Habitica's /content catalogue.
+
+/content weighs several megabytes, but a command only ever needs a
+handful of its entries (a quest, a food, an egg...). The catalogue is
+downloaded once per server version and split into a data file holding
+every entry as its own JSON document, plus a small index of
+(offset, length) pairs per section and key. Lookups mmap the data file
+and decode just the requested entry.
+"""
+
+
+import json
+import logging
+import mmap
+import os
+
+from . import codec
+
+INDEX_FILE = 'content.idx'
+
+
+class ContentStore(object):
+    """
+    Versioned, memory-mapped store of /content entries.
+
+        store = ContentStore(directory)
+        store.refresh(hbt, version=party['appVersion'])
+        store.get('quests', 'vice1')['text']
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.version = None
+        self.index = None
+        self.data_file = None
+        self._data = None
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE)) as f:
+                meta = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        self.version = meta['version']
+        self.data_file = meta['data_file']
+        self.index = meta['index']
+
+    def refresh(self, hbt, version=None):
+        """
+        Download /content if nothing is stored yet or the server's content
+        `version` (the appVersion of any API response) differs.
+        """
+        if self.index is not None and (version is None or
+                                       version == self.version):
+            return False
+        logging.info('Updating content catalogue (version %s)...' % version)
+        content = hbt.content()
+        self.build(content['data'], version or content.get('appVersion'))
+        return True
+
+    def build(self, data, version):
+        """
+        Write `data` (the /content document) as the store's new version.
+
+        The data file and then the index are written to temporary files
+        and renamed into place, so readers always see complete files.
+        The data file the replaced index pointed to may still be in use
+        by a reader that loaded that index; it is only deleted by the
+        next build, along with any older one.
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        data_file = 'content-%s.dat' % version
+        data_path = os.path.join(self.directory, data_file)
+        index = {}
+        offset = 0
+        tmp = '%s.%d.tmp' % (data_path, os.getpid())
+        with open(tmp, 'wb') as f:
+            for section, entries in data.items():
+                if not isinstance(entries, dict):
+                    continue
+                section_index = index[section] = {}
+                for key, value in entries.items():
+                    blob = codec.dumps(value)
+                    f.write(blob)
+                    section_index[key] = (offset, len(blob))
+                    offset += len(blob)
+        os.replace(tmp, data_path)
+
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        previous = ContentStore(self.directory).data_file
+        tmp = '%s.%d.tmp' % (index_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump({'version': version, 'data_file': data_file,
+                       'index': index}, f)
+        os.replace(tmp, index_path)
+
+        self.close()
+        self.version, self.data_file, self.index = version, data_file, index
+        for name in os.listdir(self.directory):
+            if name.startswith('content-') and name.endswith('.dat') and \
+                    name not in (data_file, previous):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def get(self, section, key, default=None):
+        """Return the decoded entry `key` of `section`, or `default`."""
+        if self.index is None:
+            return default
+        position = self.index.get(section, {}).get(key)
+        if position is None:
+            return default
+        if self._data is None:
+            with open(os.path.join(self.directory, self.data_file), 'rb') as f:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset, length = position
+        return codec.loads(self._data[offset:offset + length])
+
+    def keys(self, section):
+        return list(self.index.get(section, {})) if self.index else []
+
+    def close(self):
+        if self._data is not None:
+            self._data.close()
+            self._data = None
@@ -12,41 +12,73 @@ TODO:philadams get logger named, like requests!
 """
 
 
-from bisect import bisect
+# only cheap modules are imported up front: each command imports what it
+# needs, so `--version`, `--help` and `home` start fast
 import logging
 import os.path
-from time import sleep
-from webbrowser import open_new_tab
-import itertools
-from docopt import docopt
-from . import api
-
-try:
-    import ConfigParser as configparser
-except:
-    import configparser
+import sys
 
 RED = "\033[91m"
 GREEN = "\033[92m"
 DATE_FORMAT = "%Y%m%d"
 VERSION = 'habitica version 0.0.13'
 TASK_VALUE_BASE = 0.9747  # http://habitica.wikia.com/wiki/Task_Value
-HABITICA_REQUEST_WAIT_TIME = 0.5  # time to pause between concurrent requests
 HABITICA_TASKS_PAGE = '/#/tasks'
 # https://trello.com/c/4C8w1z5h/17-task-dif-settings-v2-priority-multiplier
 PRIORITY = {'easy': 1,
             'medium': 1.5,
             'hard': 2}
 AUTH_CONF = os.path.expanduser('~') + '/.config/habitica/auth.cfg'
-CACHE_CONF = os.path.expanduser('~') + '/.config/habitica/cache.cfg'
+# [Habitica] is the default account, [Habitica:<name>] the others
+AUTH_SECTION = 'Habitica'
+DEFAULT_PROFILE = 'default'
+CACHE_DB = os.path.expanduser('~') + '/.config/habitica/cache.db'
+SNAPSHOT_DIR = os.path.expanduser('~') + '/.config/habitica/snapshots'
+CONTENT_DIR = os.path.expanduser('~') + '/.config/habitica/content'
+JOURNAL_FILE = os.path.expanduser('~') + '/.config/habitica/journal.jsonl'
+SEARCH_DB = os.path.expanduser('~') + '/.config/habitica/search.db'
 
 SECTION_CACHE_QUEST = 'Quest'
 
+# user document fields (GET /user?userFields=...) each command reads
+USER_FIELDS_STATUS = ['stats', 'items.food', 'items.currentPet',
+                      'items.currentMount', 'preferences.sleep']
+USER_FIELDS_PET = ['items.pets', 'items.food']
+USER_FIELDS_EGG = ['items.pets', 'items.eggs', 'items.hatchingPotions']
+USER_FIELDS_SLEEP = ['preferences.sleep']
+
+# seconds between `status --watch` polls: back off while nothing changes
+WATCH_MIN_INTERVAL = 5
+WATCH_MAX_INTERVAL = 60
+WATCH_BACKOFF = 1.5
+
+# values of the v3 `type` filter on GET /tasks/user
+TASK_TYPE_HABITS = 'habits'
+TASK_TYPE_DAILIES = 'dailys'
+TASK_TYPE_TODOS = 'todos'  # only the todos that are still open
+TASK_TYPE_COMPLETED_TODOS = 'completedTodos'
+# the command listing each task type, as find names them
+TASK_TYPE_COMMANDS = {TASK_TYPE_HABITS: 'habits',
+                      TASK_TYPE_DAILIES: 'dailies',
+                      TASK_TYPE_TODOS: 'todos',
+                      TASK_TYPE_COMPLETED_TODOS: 'todos --completed'}
+TASK_QUERY_PREFIX = 'q:'  # `todos done q:milk` picks tasks by search
+
 def colorprint(name, color):
     return (color+"{}\033[00m" .format(name))
 
-def load_auth(configfile):
-    """Get authentication data from the AUTH_CONF file."""
+def profile_section(profile):
+    """The auth.cfg section of `profile` (None for the default one)."""
+    if profile in (None, DEFAULT_PROFILE):
+        return AUTH_SECTION
+    return '%s:%s' % (AUTH_SECTION, profile)
+
+
+def read_auth_config(configfile):
+    try:
+        import ConfigParser as configparser
+    except ImportError:
+        import configparser
 
     logging.debug('Loading habitica auth data from %s' % configfile)
 
@@ -60,55 +92,70 @@ def load_auth(configfile):
     config.readfp(cf)
 
     cf.close()
+    return config
+
+
+def load_profiles(configfile):
+    """Names of the accounts in the AUTH_CONF file, in file order."""
+    profiles = []
+    for section in read_auth_config(configfile).sections():
+        if section == AUTH_SECTION:
+            profiles.append(DEFAULT_PROFILE)
+        elif section.startswith(AUTH_SECTION + ':'):
+            profiles.append(section[len(AUTH_SECTION) + 1:])
+    return profiles
+
+
+def load_auth(configfile, profile=None):
+    """
+    Get authentication data from the AUTH_CONF file, for `profile`
+    (the default account if None). Profiles without a url use the
+    default account's.
+    """
+
+    try:
+        import ConfigParser as configparser
+    except ImportError:
+        import configparser
+
+    config = read_auth_config(configfile)
+    section = profile_section(profile)
 
     # Get data from config
     rv = {}
     try:
-        rv = {'url': config.get('Habitica', 'url'),
-              'x-api-user': config.get('Habitica', 'login'),
-              'x-api-key': config.get('Habitica', 'password')}
+        url_section = section
+        if not config.has_option(section, 'url') and \
+                config.has_section(AUTH_SECTION):
+            url_section = AUTH_SECTION
+        rv = {'url': config.get(url_section, 'url'),
+              'x-api-user': config.get(section, 'login'),
+              'x-api-key': config.get(section, 'password')}
 
     except configparser.NoSectionError:
-        logging.error("No 'Habitica' section in '%s'" % configfile)
+        logging.error("No '%s' section in '%s'" % (section, configfile))
         exit(1)
 
     except configparser.NoOptionError as e:
         logging.error("Missing option in auth file '%s': %s"
-                      % (configfile, e.message))
+                      % (configfile, e))
         exit(1)
 
     # Return auth data as a dictionnary
     return rv
 
 
-def load_cache(configfile):
-    logging.debug('Loading cached config data (%s)...' % configfile)
-
-    defaults = {'quest_key': '',
-                'quest_s': 'Not currently on a quest'}
-
-    cache = configparser.SafeConfigParser(defaults)
-    cache.read(configfile)
+def load_cache(dbfile):
+    from . import cache
 
-    if not cache.has_section(SECTION_CACHE_QUEST):
-        cache.add_section(SECTION_CACHE_QUEST)
-    return cache
+    logging.debug('Loading cached data (%s)...' % dbfile)
+    return cache.Cache(dbfile)
 
 
-def update_quest_cache(configfile, **kwargs):
-    logging.debug('Updating (and caching) config data (%s)...' % configfile)
-
-    cache = load_cache(configfile)
-
-    for key, val in kwargs.items():
-        cache.set(SECTION_CACHE_QUEST, key, val)
-
-    with open(configfile, 'wb') as f:
-        cache.write(f)
-
-    cache.read(configfile)
-
-    return cache
+def update_quest_cache(store, **kwargs):
+    logging.debug('Updating (and caching) quest data (%s)...' % store.path)
+    store.update(SECTION_CACHE_QUEST, kwargs)
+    return store
 
 
 def get_task_ids(tids):
@@ -132,42 +179,906 @@ def get_task_ids(tids):
     return [e - 1 for e in set(task_ids)]
 
 
+def select_tasks(snap, tids):
+    """
+    Like get_task_ids, but `tids` may also hold `q:<query>` targets,
+    which pick every task of `snap`'s list that find <query> matches.
+    """
+    numbers = [tid for tid in tids if not tid.startswith(TASK_QUERY_PREFIX)]
+    positions = set(get_task_ids(numbers))
+    queries = [tid[len(TASK_QUERY_PREFIX):] for tid in tids
+               if tid.startswith(TASK_QUERY_PREFIX)]
+    if queries:
+        index = open_search_index()
+        try:
+            for query in queries:
+                matches = index.search(snap.account, query, [snap.task_type])
+                if not matches:
+                    raise ValueError('no task matches \'%s\'' % query)
+                positions.update(match.position - 1 for match in matches)
+        finally:
+            index.close()
+    return list(positions)
+
+
+def open_search_index():
+    from . import search
+
+    return search.SearchIndex(SEARCH_DB)
+
+
+def index_tasks(snap, tasks):
+    """Bring the search index of `snap`'s list in line with task dicts."""
+    index = open_search_index()
+    try:
+        count = index.update(snap.account, snap.task_type, tasks)
+    finally:
+        index.close()
+    logging.debug('Reindexed %d %s tasks' % (count, snap.task_type))
+
+
+def get_task_snapshot(hbt, task_type, offline=False, local=False):
+    """
+    Load the account's snapshot of `task_type` (one of the TASK_TYPE_*
+    values) and revalidate it with the server, unless `offline`, or
+    `local` and there is a snapshot to use (--defer must work without
+    the server; its task positions refer to the last listing anyway).
+    The tasks are in `.tasks`; call `.save()` after changing them.
+    """
+    from . import snapshot
+
+    logging.debug('Loading %s tasks' % task_type)
+    snap = snapshot.TaskSnapshot(SNAPSHOT_DIR, hbt.auth['x-api-user'], task_type)
+    offline = offline or (local and snap.tasks is not None)
+    try:
+        snap.fetch(hbt, offline=offline)
+    except snapshot.SnapshotMissing as e:
+        logging.error('Cannot list tasks offline: %s' % e)
+        exit(1)
+    index_tasks(snap, snap.tasks)
+    return snap
+
+
+def stream_tasks(hbt, task_type, offline=False):
+    """
+    Yield the tasks of `task_type` as tasks.Task objects while they are
+    downloaded (and snapshotted and indexed), for listings that only
+    look at each task once.
+    """
+    from . import search, snapshot
+    from .tasks import Task
+
+    logging.debug('Streaming %s tasks' % task_type)
+    snap = snapshot.TaskSnapshot(SNAPSHOT_DIR, hbt.auth['x-api-user'], task_type)
+    if offline and snap.tasks is None:
+        logging.error('Cannot list tasks offline: no %s snapshot at %s'
+                      % (task_type, snap.path))
+        exit(1)
+
+    def tasks():
+        indexed = []
+        for data in snap.stream(hbt, offline):
+            indexed.append(dict((field, data.get(field))
+                                for field in search.INDEXED_FIELDS))
+            yield Task.from_dict(data)
+        index_tasks(snap, indexed)
+    return tasks()
+
+
+def load_tasks(hbt, task_type, offline=False, local=False):
+    """
+    Return the snapshot of `task_type` (see get_task_snapshot) and its
+    tasks as a tasks.TaskList. Save changes with save_tasks.
+    """
+    from .tasks import TaskList
+
+    snap = get_task_snapshot(hbt, task_type, offline, local)
+    return snap, TaskList.from_dicts(snap.tasks)
+
+
+def save_tasks(snap, tasks):
+    snap.tasks = tasks.to_dicts()
+    snap.save()
+    index_tasks(snap, snap.tasks)
+
+
+def load_content(hbt, version=None):
+    """
+    Open the local /content store, refreshing it first if the server's
+    content `version` (an API response's appVersion) changed.
+    """
+    from . import content
+
+    store = content.ContentStore(CONTENT_DIR)
+    store.refresh(hbt, version)
+    return store
+
+
+def content_text(store, section, key):
+    """Display name of a /content entry, falling back to its key."""
+    return store.get(section, key, {}).get('text', key)
+
+
 def updated_task_list(tasks, tids, cid = None):
-    for tid in sorted(tids, reverse=True):
+    # resolve every position first: removals shift the positions after them
+    for task in tasks.resolve(tids):
         if cid != None:
-            tasks[tid]['checklist'][cid]['completed'] = True
-        else: del(tasks[tid])
+            task.checklist[cid].completed = True
+        else: tasks.remove(task.id)
     return tasks
 
 def print_task_list(tasks):
     for i, task in enumerate(tasks):
-        completed = 'x' if task['completed'] else ' '
-        if 'date' in task and task['date'] != 'None':
-            date_string = task['date'][:10]
-            print('[%s] %s %s %s' % (completed, i + 1, task['text'].encode('utf8'), colorprint('| due to:'+date_string, RED)))
-        else: print('[%s] %s %s' % (completed, i + 1, task['text'].encode('utf8')))
-        if 'checklist' in task:
-            for j, checklist in enumerate(task['checklist']):
-                completed_checklist = colorprint('x', GREEN) if checklist['completed'] else ' '
-                print ('  '+'[%s] %s %s' % (completed_checklist, j + 1, checklist['text'].encode('utf8')))
+        completed = 'x' if task.completed else ' '
+        if task.date:
+            date_string = task.date[:10]
+            print('[%s] %s %s %s' % (completed, i + 1, task.text.encode('utf8'), colorprint('| due to:'+date_string, RED)))
+        else: print('[%s] %s %s' % (completed, i + 1, task.text.encode('utf8')))
+        for j, checklist in enumerate(task.checklist):
+            completed_checklist = colorprint('x', GREEN) if checklist.completed else ' '
+            print ('  '+'[%s] %s %s' % (completed_checklist, j + 1, checklist.text.encode('utf8')))
+
+def print_habit_list(habits):
+    for i, task in enumerate(habits):
+        score = qualitative_task_score_from_value(task.value)
+        print('[%s] %s %s' % (score, i + 1, task.text.encode('utf8')))
 
 def qualitative_task_score_from_value(value):
     # task value/score info: http://habitica.wikia.com/wiki/Task_Value
+    from bisect import bisect
+
     scores = ['*', '**', '***', '****', '*****', '******', '*******']
     breakpoints = [-20, -10, -1, 1, 5, 10]
     return scores[bisect(breakpoints, value)]
 
+def open_journal():
+    from . import journal
+
+    return journal.Journal(JOURNAL_FILE)
+
+
+def start_background_sync(profile=None):
+    """Send deferred changes from a detached process (or the daemon)."""
+    import subprocess
+    from . import daemon
+
+    if profile is None and daemon.is_running():
+        return  # the daemon replays the journal on its own
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [package_root, os.environ.get('PYTHONPATH', '')]))
+    devnull = open(os.devnull, 'w')
+    argv = ['sync'] + (['--account=%s' % profile] if profile else [])
+    subprocess.Popen([sys.executable, '-c',
+                      'import habitica; habitica.cli(%r)' % argv],
+                     env=env, stdout=devnull, stderr=devnull,
+                     start_new_session=True)
+    print('changes queued, sending them in the background')
+
+
+def score_tasks(hbt, tasks, defer=False, coalesce=None, **kwargs):
+    """
+    Score `tasks` concurrently, throttled by the client's rate limiter.
+    Each score goes through the journal first (see open_journal), with
+    `defer` and `coalesce` as in Journal.submit. `kwargs` are passed on
+    to the score endpoint; returns the batch outcomes in task order.
+    """
+    from . import batch
+
+    log = open_journal()
+    return batch.run_batch(
+        lambda task: log.submit(hbt.tasks.score, coalesce=coalesce,
+                                defer=defer, _id=task.id, **kwargs),
+        tasks)
+
+def print_failure(task, error):
+    print(colorprint('failed to score task \'%s\': %s'
+                     % (task.text.encode('utf8'), error), RED))
+
+def confirm(question, args):
+    """Ask a yes/no question, unless --yes answered it already."""
+    if args['--yes']:
+        return True
+    return input(question) == 'y'
+
 def sleep_or_not(data):
     if data: return "sleeping"
     else: return "awake"
 
 
-def cli():
+def server_command(hbt, args):
+    """GET server status."""
+    server = hbt.status()['data']
+    if server['status'] == 'up':
+        print('Habitica server is up')
+    else:
+        print('Habitica server down... or your computer cannot connect')
+
+
+def home_command(auth, args):
+    """Open HABITICA_TASKS_PAGE (needs no api client)."""
+    from webbrowser import open_new_tab
+
+    home_url = '%s%s' % (auth['url'], HABITICA_TASKS_PAGE)
+    print('Opening %s' % home_url)
+    open_new_tab(home_url)
+
+
+def status_fields(hbt, user_response, party):
+    """
+    The values `status` shows for a /user (USER_FIELDS_STATUS) and a
+    /groups/party response, by name, in display order.
+    """
+    from collections import OrderedDict
+
+    quest_cache = load_cache(CACHE_DB)
+    user = user_response['data']
+    stats = user.get('stats', '')
+    items = user.get('items', '')
+    food_count = sum(items['food'].values())
+    user_status = sleep_or_not(user['preferences']['sleep'])
+
+    # gather quest progress information (yes, janky. the API
+    # doesn't make this stat particularly easy to grab...).
+    # quest metadata comes from the local /content store, and the
+    # bits we need about the current quest are cached in CACHE_DB.
+    quest = 'Not currently on a quest'
+    # if (party is not None and party.get('quest', '')):
+    if party is not None and party['data'].get('quest') and party['data']['quest']['active']:
+        quest_key = party['data']['quest']['key']
+        if quest_cache.get(SECTION_CACHE_QUEST, 'quest_key', '') != quest_key:
+            # we're on a new quest, update quest key
+            logging.info('Updating quest information...')
+            store = load_content(hbt, party.get('appVersion'))
+            quest_info = store.get('quests', quest_key, {})
+            store.close()
+            quest_type = ''
+            quest_max = '-1'
+            quest_title = quest_info['text']
+
+            # if there's a content/quests/<quest_key/collect,
+            # then drill into .../collect/<whatever>/count and
+            # .../collect/<whatever>/text and get those values
+            if quest_info.get('collect'):
+                logging.debug("\tOn a collection type of quest")
+                quest_type = 'collect'
+                clct = list(quest_info['collect'].values())[0]
+                quest_max = clct['count']
+            # else if it's a boss, then hit up
+            # content/quests/<quest_key>/boss/hp
+            elif quest_info.get('boss'):
+                logging.debug("\tOn a boss/hp type of quest")
+                quest_type = 'hp'
+                quest_max = quest_info['boss']['hp']
+
+            # store repr of quest info from /content
+            quest_cache = update_quest_cache(quest_cache,
+                                             quest_key=str(quest_key),
+                                             quest_type=str(quest_type),
+                                             quest_max=str(quest_max),
+                                             quest_title=str(quest_title))
+
+        # now we use /party and quest_type to figure out our progress!
+        quest_type = quest_cache.get(SECTION_CACHE_QUEST, 'quest_type')
+        if quest_type == 'collect':
+            qp_tmp = party['data']['quest']['progress']['collect']
+            quest_progress = list(qp_tmp.values())[0]
+        else:
+            quest_progress = party['data']['quest']['progress']['hp']
+
+        quest = '%s/%s "%s"' % (
+                str(int(quest_progress)),
+                quest_cache.get(SECTION_CACHE_QUEST, 'quest_max'),
+                quest_cache.get(SECTION_CACHE_QUEST, 'quest_title'))
+    quest_cache.close()
+
+    # prepare status strings
+    title = 'Level %d %s' % (stats['lvl'], stats['class'].capitalize())
+    health = '%d/%d' % (stats['hp'], stats['maxHealth'])
+    xp = '%d/%d' % (int(stats['exp']), stats['toNextLevel'])
+    mana = '%d/%d' % (int(stats['mp']), stats['maxMP'])
+    currentPet = items.get('currentPet', '')
+    pet = '%s (%d food items)' % (currentPet, food_count)
+    mount = items.get('currentMount', '')
+    return OrderedDict([('title', title), ('health', health), ('xp', xp),
+                        ('mana', mana), ('pet', pet), ('mount', mount),
+                        ('quest', quest), ('status', user_status)])
+
+
+def status_lines(fields):
+    """The lines printed for status_fields()."""
+    summary_items = ('health', 'xp', 'mana', 'quest', 'pet', 'mount')
+    len_ljust = max(map(len, summary_items)) + 1
+    title = fields['title']
+    lines = ['-' * len(title), title, '-' * len(title)]
+    for name, label in (('health', 'Health:'), ('xp', 'XP:'),
+                        ('mana', 'Mana:'), ('pet', 'Pet:'),
+                        ('mount', 'Mount:'), ('quest', 'Quest:'),
+                        ('status', 'Status:')):
+        lines.append('%s %s' % (label.rjust(len_ljust, ' '), fields[name]))
+    return lines
+
+
+def fetch_if_changed(endpoint, etag, **kwargs):
+    """
+    GET `endpoint` unless it still has ETag `etag`. Returns the decoded
+    body (None if unchanged) and the ETag to send next time.
+    """
+    from .api import decode
+
+    headers = {'If-None-Match': etag} if etag else {}
+    res = endpoint(_headers=headers, _raw=True, **kwargs)
+    if res.status_code == 304:
+        return None, etag
+    return decode(res), res.headers.get('ETag')
+
+
+def watch_status(hbt, args):
+    """
+    Poll user and party, redrawing only the status lines that changed
+    (or, with --json, printing a JSON line of the changed fields).
+    Polls back off while nothing changes and speed up again on change;
+    a failed poll is logged and retried after WATCH_MAX_INTERVAL.
+    """
+    import json
+    import time
+    import requests
+    from . import batch
+
+    interactive = sys.stdout.isatty() and not args['--json']
+    interval = WATCH_MIN_INTERVAL
+    etags = {'user': None, 'party': None}
+    user_response = party = None
+    version = quest = None
+    shown = None  # fields on screen
+    while True:
+        try:
+            (new_user, user_etag), (new_party, party_etag) = batch.fan_out(
+                lambda: fetch_if_changed(
+                    hbt.user, etags['user'],
+                    userFields=USER_FIELDS_STATUS + ['_v']),
+                lambda: fetch_if_changed(hbt.groups.party, etags['party']))
+        except requests.RequestException as e:
+            # the server or the network is down: keep watching, slowly
+            logging.warning('Status poll failed: %s' % e)
+            interval = WATCH_MAX_INTERVAL
+            time.sleep(interval)
+            continue
+        etags['user'], etags['party'] = user_etag, party_etag
+        # a new body isn't news unless the user's version or the quest moved
+        changed = False
+        if new_user is not None and (version is None or
+                                     new_user['data'].get('_v') != version):
+            user_response, version = new_user, new_user['data'].get('_v')
+            changed = True
+        if new_party is not None and (party is None or
+                                      new_party['data'].get('quest') != quest):
+            party, quest = new_party, new_party['data'].get('quest')
+            changed = True
+
+        delta = {}
+        if changed:
+            fields = status_fields(hbt, user_response, party)
+            delta = dict((name, value) for name, value in fields.items()
+                         if shown is None or shown[name] != value)
+        if delta:
+            if args['--json']:
+                print(json.dumps({'time': time.time(), 'changed': delta}))
+            elif not interactive or shown is None:
+                lines = status_lines(fields)
+                if shown is not None:  # only the lines that differ
+                    lines = [line for line, old in
+                             zip(lines, status_lines(shown)) if line != old]
+                print('\n'.join(lines))
+            else:
+                redraw_lines(status_lines(shown), status_lines(fields))
+            sys.stdout.flush()
+            shown = fields
+            interval = WATCH_MIN_INTERVAL
+        else:
+            interval = min(interval * WATCH_BACKOFF, WATCH_MAX_INTERVAL)
+        time.sleep(interval)
+
+
+def redraw_lines(old, new):
+    """Rewrite, in place, the lines of `old` (the last lines printed) that differ in `new`."""
+    for i, (before, after) in enumerate(zip(old, new)):
+        if before != after:
+            up = len(old) - i
+            sys.stdout.write('\033[%dA\r\033[2K%s\033[%dB\r' % (up, after, up))
+
+
+def status_command(hbt, args):
+    """GET user and party; show HP, XP, quest and more."""
+    from . import batch
+
+    if args['--watch']:
+        try:
+            watch_status(hbt, args)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # gather status info
+    # user and party don't depend on each other: fetch both at once
+    user_response, party = batch.fan_out(
+        lambda: hbt.user(userFields=USER_FIELDS_STATUS),
+        hbt.groups.party)
+    fields = status_fields(hbt, user_response, party)
+    if args['--json']:
+        import json
+        print(json.dumps(fields))
+        return
+    for line in status_lines(fields):
+        print(line)
+
+
+def habits_command(hbt, args):
+    """GET/POST habits."""
+    if not args['<args>']:
+        print_habit_list(stream_tasks(hbt, TASK_TYPE_HABITS,
+                                      args['--offline']))
+        return
+    snap, habits = load_tasks(hbt, TASK_TYPE_HABITS, args['--offline'],
+                              local=args['--defer'])
+    if 'up' in args['<args>']:
+        tids = select_tasks(snap, args['<args>'][1:])
+        for task, _, error in score_tasks(hbt, habits.resolve(tids),
+                                          defer=args['--defer'],
+                                          _direction='up', _method='post'):
+            if error is not None:
+                print_failure(task, error)
+                continue
+            tval = task.value
+            print('incremented task \'%s\'' % task.text.encode('utf8'))
+            task.value = tval + (TASK_VALUE_BASE ** tval)
+    elif 'down' in args['<args>']:
+        tids = select_tasks(snap, args['<args>'][1:])
+        for task, _, error in score_tasks(hbt, habits.resolve(tids),
+                                          defer=args['--defer'],
+                                          _direction='down', _method='post'):
+            if error is not None:
+                print_failure(task, error)
+                continue
+            tval = task.value
+            print('decremented task \'%s\'' % task.text.encode('utf8'))
+            task.value = tval - (TASK_VALUE_BASE ** tval)
+    save_tasks(snap, habits)
+    print_habit_list(habits)
+
+
+def dailies_command(hbt, args):
+    """GET/PUT tasks:daily."""
+    if not args['<args>']:
+        print_task_list(stream_tasks(hbt, TASK_TYPE_DAILIES,
+                                     args['--offline']))
+        return
+    snap, dailies = load_tasks(hbt, TASK_TYPE_DAILIES, args['--offline'],
+                               local=args['--defer'])
+    if 'done' in args['<args>']:
+        tids = select_tasks(snap, args['<args>'][1:])
+        for task, _, error in score_tasks(hbt, dailies.resolve(tids),
+                                          defer=args['--defer'],
+                                          coalesce='dedupe',
+                                          _direction='up', _method='post'):
+            if error is not None:
+                print_failure(task, error)
+                continue
+            print('marked daily \'%s\' completed'
+                  % task.text.encode('utf8'))
+            task.completed = True
+    elif 'undo' in args['<args>']:
+        tids = select_tasks(snap, args['<args>'][1:])
+        for task, _, error in score_tasks(hbt, dailies.resolve(tids),
+                                          defer=args['--defer'],
+                                          coalesce='dedupe',
+                                          _method='put', completed=False):
+            if error is not None:
+                print_failure(task, error)
+                continue
+            print('marked daily \'%s\' incomplete'
+                  % task.text.encode('utf8'))
+            task.completed = False
+    save_tasks(snap, dailies)
+    print_task_list(dailies)
+
+
+def todos_command(hbt, args):
+    """GET/POST tasks:todo."""
+    from .tasks import Task
+
+    if args['--completed']:
+        if args['<args>']:
+            raise ValueError('--completed can only be used to list todos')
+        # completed todos are only downloaded when explicitly asked for,
+        # and can be many: render them as they come in
+        print_task_list(stream_tasks(hbt, TASK_TYPE_COMPLETED_TODOS,
+                                     args['--offline']))
+        return
+    if not args['<args>']:
+        print_task_list(stream_tasks(hbt, TASK_TYPE_TODOS, args['--offline']))
+        return
+    snap, todos = load_tasks(hbt, TASK_TYPE_TODOS, args['--offline'],
+                             local=args['--defer'])
+
+    if 'done' in args['<args>']:
+        ids = args['<args>'][1:]
+        ## for checklist
+        if len([x for x in ids
+                if '.' in x and not x.startswith(TASK_QUERY_PREFIX)]):
+            cid = int(ids[0].split('.')[1]) - 1
+            tids = get_task_ids(ids[0].split('.')[0])
+            task = todos[tids[0]]
+            open_journal().submit(hbt.tasks.checklist.score,
+                                  coalesce='toggle', defer=args['--defer'],
+                                  _id=task.id,
+                                  _cid=task.checklist[cid].id,
+                                  _method='post', completed=True)
+            print('marked todo \'%s\' complete'
+                  % task.text.encode('utf8'))
+            todos = updated_task_list(todos, tids, cid)
+        ## for task
+        else:
+            tids = select_tasks(snap, ids)
+            outcomes = score_tasks(hbt, todos.resolve(tids),
+                                   defer=args['--defer'], coalesce='dedupe',
+                                   _direction='up', _method='post',
+                                   completed=True)
+            for task, _, error in outcomes:
+                if error is not None:
+                    print_failure(task, error)
+                    continue
+                print('marked todo \'%s\' complete'
+                      % task.text.encode('utf8'))
+            done = [tid for tid, outcome in zip(tids, outcomes)
+                    if outcome.error is None]
+            todos = updated_task_list(todos, done)
+    elif 'add' in args['<args>']:
+        ttext = ' '.join(args['<args>'][1:])
+
+        from .journal import DEFERRED
+
+        created = open_journal().submit(hbt.tasks.user,
+                   defer=args['--defer'],
+                   type='todo',
+                   text=ttext,
+                   priority=PRIORITY[args['--dif']],
+                   date=args['--date'],
+                   _method='post')
+        if created is DEFERRED:
+            # not created yet: have the next listing refetch
+            snap.etag = None
+        else:
+            todos.add(Task.from_dict(created['data']), top=True)
+        print('added new todo \'%s\'' % ttext.encode('utf8'))
+    elif 'add_cl' in args['<args>']:
+        from .journal import DEFERRED
+
+        if args['--task'] == '-1':
+            raise ValueError('task id must be given after --task=')
+        else:
+            ttext = ' '.join(args['<args>'][1:])
+            tids = select_tasks(snap, [args['--task']])
+            if len(tids) != 1:
+                raise ValueError('--task=%s picks %d todos, not one'
+                                 % (args['--task'], len(tids)))
+            tid = tids[0]
+            updated = open_journal().submit(hbt.tasks.checklist,
+                       defer=args['--defer'],
+                       type='todo',
+                       _id=todos[tid].id,
+                       text=ttext,
+                       _method='post')
+        if updated is DEFERRED:
+            snap.etag = None
+        else:
+            # the server answers with the whole task, new item included
+            todos.add(Task.from_dict(updated['data']))
+    save_tasks(snap, todos)
+    print_task_list(todos)
+
+
+def find_command(hbt, args):
+    """Search tasks and their checklists, best matches first."""
+    from .search import tokenize
+
+    query = ' '.join(args['<args>'])
+    if not tokenize(query):
+        raise ValueError('find needs a word to look for')
+    task_types = [TASK_TYPE_HABITS, TASK_TYPE_DAILIES, TASK_TYPE_TODOS]
+    if args['--completed']:
+        task_types.append(TASK_TYPE_COMPLETED_TODOS)
+    account = hbt.auth['x-api-user']
+    if not args['--offline']:
+        # revalidating reindexes whatever changed
+        for task_type in task_types:
+            get_task_snapshot(hbt, task_type)
+
+    index = open_search_index()
+    try:
+        if not args['--offline'] and index.unknown_tags(account):
+            index.set_tags(account, dict((tag['id'], tag['name'])
+                                         for tag in hbt.tags()['data']))
+        matches = index.search(account, query, task_types)
+    finally:
+        index.close()
+    if not matches:
+        print('No task matches \'%s\'' % query.encode('utf8'))
+    for match in matches:
+        print('%s %s %s' % (TASK_TYPE_COMMANDS[match.list], match.position,
+                            match.text.encode('utf8')))
+
+
+def stats_command(hbt, args):
+    """GET tasks: streaks, weekday rates and value trends from histories."""
+    import datetime
+
+    try:
+        from . import stats  # imports NumPy
+    except ImportError:
+        logging.error("'stats' needs NumPy: install it with `pip install numpy`")
+        exit(1)
+
+    words = args['<args>']
+    path = None
+    scores = stats.PROJECTED_SCORES
+    if words[:1] == ['export']:
+        if len(words) != 2:
+            raise ValueError('a file must be given after export')
+        path = words[1]
+    elif words:
+        scores = int(words[0])
+
+    tasks = []
+    for task_type in (TASK_TYPE_HABITS, TASK_TYPE_DAILIES):
+        tasks += get_task_snapshot(hbt, task_type, args['--offline']).tasks
+    offset = datetime.datetime.now().astimezone().utcoffset()
+    history = stats.History(tasks, int(offset.total_seconds() * 1000))
+    summary = history.summary(scores)
+    if path:
+        history.export(path, summary)
+        print('wrote %d history entries of %d tasks to %s'
+              % (len(history), len(tasks), path))
+        return
+    for line in stats.report_lines(history, summary, scores):
+        print(line)
+
+
+def run_plan(steps, func, what):
+    """
+    Run the steps of a feed or hatch plan concurrently, `func(step)` each,
+    and print every step's answer; `what(step)` names a step.
+    """
+    from . import batch
+
+    for outcome in batch.run_batch(func, steps):
+        if outcome.error is not None:
+            print(colorprint('%s failed: %s' % (what(outcome.item),
+                                                outcome.error), RED))
+        else:
+            print('%s: %s' % (what(outcome.item), outcome.result))
+
+
+def pet_command(hbt, args):
+    """GET/POST pets: feed every pet, matching food first, up to a mount."""
+    from . import planner
+    from .journal import DEFERRED
+
+    user_response = hbt.user(userFields=USER_FIELDS_PET)
+    store = load_content(hbt, user_response.get('appVersion'))
+    inventory = planner.Inventory(user_response['data']['items'], store)
+    feeds = planner.plan_feeds(inventory)
+    if not feeds:
+        store.close()
+        print("Oops, no food available")
+        return
+
+    def pet_name(pet):
+        return content_text(store, 'petInfo', pet)
+
+    def food_name(feed):
+        return '%d %s' % (feed.amount, content_text(store, 'food', feed.food))
+
+    for feed in feeds:
+        print('%s: %s (+%d%s)' % (pet_name(feed.pet), food_name(feed),
+                                  feed.points,
+                                  ', becomes a mount' if feed.mount else ''))
+    if args['--dry-run']:
+        store.close()
+        return
+    if confirm("Run this plan (%d requests)? [y/n] " % len(feeds), args):
+        log = open_journal()
+
+        def feed_pet(group):
+            # one pet's feeds in order, so the server sees its real value
+            messages = []
+            for feed in group:
+                response = log.submit(hbt.user.feed, defer=args['--defer'],
+                                      _inventory1=feed.pet,
+                                      _inventory2=feed.food,
+                                      _params={'amount': feed.amount},
+                                      _method='post')
+                messages.append('queued' if response is DEFERRED
+                                else response['message'])
+            return '; '.join(messages)
+
+        run_plan(planner.group_by_pet(feeds), feed_pet,
+                 lambda group: pet_name(group[0].pet))
+    else:
+        print(colorprint("Ok, pets need more care, so try to feed them next time", RED))
+    store.close()
+
+
+def egg_command(hbt, args):
+    """GET/POST pets: hatch every pet the eggs and potions allow."""
+    from . import planner
+    from .journal import DEFERRED
+
+    user_response = hbt.user(userFields=USER_FIELDS_EGG)
+    store = load_content(hbt, user_response.get('appVersion'))
+    inventory = planner.Inventory(user_response['data']['items'], store)
+    hatches = planner.plan_hatches(inventory)
+
+    def pet_name(hatch):
+        return '%s %s' % (content_text(store, 'hatchingPotions', hatch.potion),
+                          content_text(store, 'eggs', hatch.egg))
+
+    names = [pet_name(hatch) for hatch in hatches]
+    store.close()
+    if not hatches:
+        print("No egg can be hatched")
+        return
+    for name in names:
+        print("Hatch a %s" % name)
+    if args['--dry-run']:
+        return
+    if confirm("Run this plan (%d requests)? [y/n] " % len(hatches), args):
+        log = open_journal()
+
+        def hatch(step):
+            egg, potion = step[0]
+            response = log.submit(hbt.user.hatch, defer=args['--defer'],
+                                  _inventory1=egg, _inventory2=potion,
+                                  _method='post')
+            return 'queued' if response is DEFERRED else response['message']
+
+        run_plan(list(zip(hatches, names)), hatch, lambda step: step[1])
+    else:
+        print(colorprint("Ok, you are so boring", RED))
+
+
+def sleep_command(hbt, args):
+    """POST sleep: enter or leave the inn."""
+    user_status = hbt.user(userFields=USER_FIELDS_SLEEP)['data']['preferences']['sleep']
+    if user_status:
+        print("You are sleeping!")
+        if confirm("Do you want to leave inn now?[y/n] ", args):
+            hbt.user.sleep(_method='post')
+            print("Work hard, so you can play harder!")
+        else: 
+            print("Ok, sleep tight!")
+    else:
+        if confirm("Do you want to sleep now?[y/n] ", args):
+            hbt.user.sleep(_method='post')
+            print("Have a nice dream :)")
+        else: 
+            print("Then continue your work, please!")
+
+
+def fleet_command(argv, args):
+    """Run a command for several accounts (see fleet.py)."""
+    from . import fleet
+
+    command = args['<command>']
+    if command in fleet.FLEET_EXCLUDED or args['--watch']:
+        logging.error("'%s' can only be run for one account"
+                      % ' '.join([command] + ['--watch'] * args['--watch']))
+        exit(1)
+    if command in fleet.FLEET_PROMPTING and not (args['--yes'] or
+                                                 args['--dry-run']):
+        logging.error("'%s' asks for confirmation: add --yes (or --dry-run) "
+                      "to run it for several accounts" % command)
+        exit(1)
+    try:
+        profiles = fleet.select_profiles(args['--account'],
+                                         load_profiles(AUTH_CONF))
+    except ValueError as e:
+        logging.error('%s (see %s)' % (e, AUTH_CONF))
+        exit(1)
+    status = fleet.run(fleet.without_account(argv), profiles)
+    if status:
+        exit(status)
+
+
+def export_command(hbt, args):
+    """GET tasks: write them all to a NDJSON or CSV file."""
+    from . import bulk
+
+    if len(args['<args>']) != 1:
+        raise ValueError('usage: habitica export <file>|- [--completed]')
+    path = args['<args>'][0]
+    if args['--completed']:
+        tasks = hbt.tasks.user(type=TASK_TYPE_COMPLETED_TODOS, _stream=True)
+    else:
+        tasks = hbt.tasks.user(_stream=True)
+    if path == '-':
+        bulk.export_tasks(tasks, sys.stdout)
+        return
+    with open(path, 'w', newline='') as f:
+        count = bulk.export_tasks(tasks, f, bulk.file_format(path))
+    print('exported %d task(s) to %s' % (count, path))
+
+
+def import_command(hbt, args):
+    """POST tasks: create the tasks of a NDJSON or CSV file."""
+    from . import bulk
+
+    if len(args['<args>']) != 1:
+        raise ValueError('usage: habitica import <file>')
+    path = args['<args>'][0]
+    try:
+        created, skipped, failed = bulk.import_tasks(hbt, path)
+    except (IOError, OSError, ValueError) as e:
+        logging.error('Cannot import %s: %s' % (path, e))
+        exit(1)
+    print('imported %d task(s) from %s' % (created, path))
+    if skipped:
+        print('skipped %d task(s) imported before (see %s.progress)'
+              % (skipped, path))
+    if failed:
+        print(colorprint('%d task(s) failed, run the import again to retry'
+                         % failed, RED))
+
+
+def sync_command(hbt, args):
+    """Replay the changes waiting in the journal."""
+    from .journal import SyncRunning
+
+    try:
+        sent, remaining = open_journal().sync(hbt)
+    except SyncRunning as e:
+        print(e)
+        return
+    print('sent %d queued change(s), %d still pending' % (sent, remaining))
+
+
+def daemon_command(hbt, args):
+    """Serve commands forwarded by bin/habitica until stopped."""
+    from . import daemon
+
+    if 'stop' in args['<args>']:
+        daemon.stop()
+    else:
+        daemon.serve(hbt)
+
+
+# command name -> handler(hbt, args); `home` is dispatched separately
+COMMANDS = {
+    'server': server_command,
+    'status': status_command,
+    'habits': habits_command,
+    'dailies': dailies_command,
+    'todos': todos_command,
+    'find': find_command,
+    'stats': stats_command,
+    'pet': pet_command,
+    'egg': egg_command,
+    'sleep': sleep_command,
+    'export': export_command,
+    'import': import_command,
+    'sync': sync_command,
+    'daemon': daemon_command,
+}
+
+
+def cli(argv=None, hbt=None, from_daemon=False):
     """Habitica command-line interface.
 
     Usage: habitica [--version] [--help]
                     <command> [<args>...] [--dif=<d>] [--date=<d>] [--task=<d>]
-                    [--verbose | --debug]
+                    [--completed] [--offline] [--defer]
+                    [--account=<name>] [--yes] [--dry-run] [--watch] [--json]
+                    [--profile] [--trace=<file>] [--verbose | --debug]
 
     Options:
       -h --help         Show this screen
@@ -175,11 +1086,25 @@ def cli():
       --dif=<d>         (easy | medium | hard) [default: easy]
       --date=<d>        [default: None]
       --task=<d>        [default: -1]
+      --completed       Completed todos instead of open ones (todos, find, export)
+      --offline         Use local task snapshots, not the server (listings,
+                        find, stats)
+      --defer           Queue changes and send them in the background;
+                        task positions refer to the last listing
+      --account=<name>  Act as the auth.cfg profile <name>; `all` or a
+                        comma-separated list runs the command for each
+      --yes             Answer yes to questions (pet, egg, sleep)
+      --dry-run         Show the feeding or hatching plan only (pet, egg)
+      --watch           Keep the status up to date (status)
+      --json            Print JSON: changed fields only with --watch (status)
+      --profile         Print a summary of the requests made
+      --trace=<file>    Append a JSON line per request made to <file>
       --verbose         Show some logging information
       --debug           Some all logging information
 
     The habitica commands are:
       status                  Show HP, XP, GP, and more
+      status --watch          Poll the status, redrawing what changes
       habits                  List habit tasks
       habits up <task-id>     Up (+) habit <task-id>
       habits down <task-id>   Down (-) habit <task-id>
@@ -191,19 +1116,38 @@ def cli():
       todos done <task-id>.<checklist-id> Mark one todo <checklist-id> in <task-id> completed
       todos add <task>        Add todo with description <task>
       todos add_cl <task-id>  Add checklist item with description <task>
+      find <query>            Search task texts, notes, tags and checklists
+      stats [<n>]             Streaks, weekday rates, trends and values after
+                              <n> more scores, from task histories (NumPy)
+      stats export <file>     Save the history arrays and stats to <file>.npz
       server                  Show status of Habitica service
       home                    Open tasks page in default browser
-      pet                     Check pet and feed if possible
-      egg                     Check egg and hatch if possible
+      pet                     Feed all pets, matching food first, up to mounts
+      egg                     Hatch every pet the eggs and potions allow
       sleep                   Check sleeping status and moving in/leaving inn
+      export <file>           Write all tasks to <file> (.csv, or NDJSON)
+      import <file>           Create the tasks listed in <file>
+      sync                    Send changes queued by --defer or failed requests
+      daemon                  Serve commands from a warm background process
+      daemon stop             Stop the background process
 
     For `habits up|down`, `dailies done|undo`, and `todos done`, you can pass
     one or more <task-id> parameters, using either comma-separated lists or
-    ranges or both. For example, `todos done 1,3,6-9,11`.
+    ranges or both. For example, `todos done 1,3,6-9,11`. A `q:<query>`
+    parameter picks every task that `find <query>` lists, e.g.
+    `dailies done q:gym` or `todos add_cl --task=q:groceries milk`.
     """
 
+    # --version is answered before paying for docopt
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv == ['--version']:
+        print(VERSION)
+        return
+
     # set up args
-    args = docopt(cli.__doc__, version=VERSION)
+    from docopt import docopt
+    args = docopt(cli.__doc__, argv=argv, version=VERSION)
 
     # set up logging
     if args['--verbose']:
@@ -214,278 +1158,59 @@ def cli():
     logging.debug('Command line args: {%s}' %
                   ', '.join("'%s': '%s'" % (k, v) for k, v in args.items()))
 
-    # Set up auth
-    auth = load_auth(AUTH_CONF)
+    if args['--offline'] and not (
+            args['<command>'] in ('find', 'stats') or not args['<args>'] and
+            args['<command>'] in ('habits', 'dailies', 'todos')):
+        logging.error('--offline only works for listing habits, dailies '
+                      'and todos, and for find and stats')
+        exit(1)
 
-    # Prepare cache
-    cache = load_cache(CACHE_CONF)
+    if args['<command>'] != 'home' and args['<command>'] not in COMMANDS:
+        logging.error("Unknown command '%s'" % args['<command>'])
+        exit(1)
 
-    # instantiate api service
-    hbt = api.Habitica(auth=auth)
+    # several accounts: fan the command out to worker processes
+    account = args['--account']
+    if hbt is None and account and (account == 'all' or ',' in account):
+        fleet_command(argv, args)
+        return
+
+    # Set up auth and instantiate api service (one pooled session shared
+    # by every request), unless we were handed a warm client by the daemon
+    own_client = hbt is None
+    auth = load_auth(AUTH_CONF, account) if own_client else hbt.auth
+    if args['<command>'] == 'home':
+        home_command(auth, args)
+        return
+    recorder = None
+    if args['--profile'] or args['--trace']:
+        from .instrument import Recorder
+        recorder = Recorder(' '.join(['habitica'] + argv))
+    if own_client:
+        from . import api
+        hbt = api.Habitica(auth=auth, recorder=recorder)
+    elif recorder is not None:
+        own_recorder, hbt.recorder = hbt.recorder, recorder
+
+    from .journal import Queued
 
-    # GET server status
-    if args['<command>'] == 'server':
-        server = hbt.status()['data']
-        if server['status'] == 'up':
-            print('Habitica server is up')
-        else:
-            print('Habitica server down... or your computer cannot connect')
-
-    # open HABITICA_TASKS_PAGE
-    elif args['<command>'] == 'home':
-        home_url = '%s%s' % (auth['url'], HABITICA_TASKS_PAGE)
-        print('Opening %s' % home_url)
-        open_new_tab(home_url)
-
-    # GET user
-    elif args['<command>'] == 'status':
-
-        # gather status info
-        user = hbt.user()['data']
-        party = hbt.groups.party()
-        stats = user.get('stats', '')
-        items = user.get('items', '')
-        food_count = sum(items['food'].values())
-        user_status = sleep_or_not(user['preferences']['sleep'])
-
-        # gather quest progress information (yes, janky. the API
-        # doesn't make this stat particularly easy to grab...).
-        # because hitting /content downloads a crapload of stuff, we
-        # cache info about the current quest in cache.
-        quest = 'Not currently on a quest'
-        # if (party is not None and party.get('quest', '')):
-        if party is not None and party['data'].get('quest') and party['data']['quest']['active']:
-            quest_key = party['data']['quest']['key']
-            if cache.get(SECTION_CACHE_QUEST, 'quest_key') != quest_key:
-                # we're on a new quest, update quest key
-                logging.info('Updating quest information...')
-                content = hbt.content()
-                quest_type = ''
-                quest_max = '-1'
-                quest_title = content['data']['quests'][quest_key]['text']
-
-                # if there's a content/quests/<quest_key/collect,
-                # then drill into .../collect/<whatever>/count and
-                # .../collect/<whatever>/text and get those values
-                if content['data'].get('quests', {}).get(quest_key, {}).get('collect'):
-                    logging.debug("\tOn a collection type of quest")
-                    quest_type = 'collect'
-                    clct = content['data']['quests'][quest_key]['collect'].values()[0]
-                    quest_max = clct['count']
-                # else if it's a boss, then hit up
-                # content/quests/<quest_key>/boss/hp
-                elif content['data'].get('quests', {}).get(quest_key, {}).get('boss'):
-                    logging.debug("\tOn a boss/hp type of quest")
-                    quest_type = 'hp'
-                    quest_max = content['data']['quests'][quest_key]['boss']['hp']
-
-                # store repr of quest info from /content
-                cache = update_quest_cache(CACHE_CONF,
-                                           quest_key=str(quest_key),
-                                           quest_type=str(quest_type),
-                                           quest_max=str(quest_max),
-                                           quest_title=str(quest_title))
-
-            # now we use /party and quest_type to figure out our progress!
-            quest_type = cache.get(SECTION_CACHE_QUEST, 'quest_type')
-            if quest_type == 'collect':
-                qp_tmp = party['data']['quest']['progress']['collect']
-                quest_progress = qp_tmp.values()[0]
-            else:
-                quest_progress = party['data']['quest']['progress']['hp']
-
-            quest = '%s/%s "%s"' % (
-                    str(int(quest_progress)),
-                    cache.get(SECTION_CACHE_QUEST, 'quest_max'),
-                    cache.get(SECTION_CACHE_QUEST, 'quest_title'))
-
-        # prepare and print status strings
-        title = 'Level %d %s' % (stats['lvl'], stats['class'].capitalize())
-        health = '%d/%d' % (stats['hp'], stats['maxHealth'])
-        xp = '%d/%d' % (int(stats['exp']), stats['toNextLevel'])
-        mana = '%d/%d' % (int(stats['mp']), stats['maxMP'])
-        currentPet = items.get('currentPet', '')
-        pet = '%s (%d food items)' % (currentPet, food_count)
-        mount = items.get('currentMount', '')
-        summary_items = ('health', 'xp', 'mana', 'quest', 'pet', 'mount')
-        len_ljust = max(map(len, summary_items)) + 1
-        print('-' * len(title))
-        print(title)
-        print('-' * len(title))
-        print('%s %s' % ('Health:'.rjust(len_ljust, ' '), health))
-        print('%s %s' % ('XP:'.rjust(len_ljust, ' '), xp))
-        print('%s %s' % ('Mana:'.rjust(len_ljust, ' '), mana))
-        print('%s %s' % ('Pet:'.rjust(len_ljust, ' '), pet))
-        print('%s %s' % ('Mount:'.rjust(len_ljust, ' '), mount))
-        print('%s %s' % ('Quest:'.rjust(len_ljust, ' '), quest))
-        print('%s %s' % ('Status:'.rjust(len_ljust, ' '), user_status))
-
-    # GET/POST habits
-    elif args['<command>'] == 'habits':
-        task_data = hbt.tasks.user()['data']
-        habits = [task for i, task in enumerate(task_data) if task['type'] == 'habit']
-        if 'up' in args['<args>']:
-            tids = get_task_ids(args['<args>'][1:])
-            for tid in tids:
-                tval = habits[tid]['value']
-
-                hbt.tasks.score(_id=habits[tid]['id'],
-                               _direction='up', _method='post')
-                print('incremented task \'%s\''
-                      % habits[tid]['text'].encode('utf8'))
-                habits[tid]['value'] = tval + (TASK_VALUE_BASE ** tval)
-                sleep(HABITICA_REQUEST_WAIT_TIME)
-        elif 'down' in args['<args>']:
-            tids = get_task_ids(args['<args>'][1:])
-            for tid in tids:
-                tval = habits[tid]['value']
-                hbt.tasks.score(_id=habits[tid]['id'],
-                               _direction='down', _method='post')
-                print('decremented task \'%s\''
-                      % habits[tid]['text'].encode('utf8'))
-                habits[tid]['value'] = tval - (TASK_VALUE_BASE ** tval)
-                sleep(HABITICA_REQUEST_WAIT_TIME)
-        for i, task in enumerate(habits):
-            score = qualitative_task_score_from_value(task['value'])
-            print('[%s] %s %s' % (score, i + 1, task['text'].encode('utf8')))
-
-    # GET/PUT tasks:daily
-    elif args['<command>'] == 'dailies':
-        task_data = hbt.tasks.user()['data']
-        dailies = [task for i, task in enumerate(task_data) if task['type'] == 'daily']
-        if 'done' in args['<args>']:
-            tids = get_task_ids(args['<args>'][1:])
-            for tid in tids:
-                hbt.tasks.score(_id=dailies[tid]['id'],
-                               _direction='up', _method='post')
-                print('marked daily \'%s\' completed'
-                      % dailies[tid]['text'].encode('utf8'))
-                dailies[tid]['completed'] = True
-                sleep(HABITICA_REQUEST_WAIT_TIME)
-        elif 'undo' in args['<args>']:
-            tids = get_task_ids(args['<args>'][1:])
-            for tid in tids:
-                hbt.tasks.score(_id=dailies[tid]['id'],
-                               _method='put', completed=False)
-                print('marked daily \'%s\' incomplete'
-                      % dailies[tid]['text'].encode('utf8'))
-                dailies[tid]['completed'] = False
-                sleep(HABITICA_REQUEST_WAIT_TIME)
-        print_task_list(dailies)
-
-    # GET tasks:todo
-    elif args['<command>'] == 'todos':
-        task_data = hbt.tasks.user()['data']
-        todos = [task for i, task in enumerate(task_data) if task['type'] == 'todo' and not task['completed']]
-        
-        if 'done' in args['<args>']:
-            ids = args['<args>'][1:]
-            ## for checklist
-            if len([x for x in ids if '.' in x]):
-                cid = int(ids[0].split('.')[1]) - 1
-                tids = get_task_ids(ids[0].split('.')[0])
-                tid = tids[0]
-                todos[tid]['checklist']
-                hbt.tasks.checklist.score(_id=todos[tid]['id'],
-                                _cid=todos[tid]['checklist'][cid]['id'],
-                                _method='post', completed = True)
-                print('marked todo \'%s\' complete'
-                      % todos[tid]['text'].encode('utf8'))
-                sleep(HABITICA_REQUEST_WAIT_TIME)
-                todos = updated_task_list(todos, tids, cid)
-            ## for task
-            else:
-                tids = get_task_ids(ids)
-                
-                for tid in tids:
-                    hbt.tasks.score(_id=todos[tid]['id'],
-                                   _direction='up', _method='post', completed = True)
-                    print('marked todo \'%s\' complete'
-                          % todos[tid]['text'].encode('utf8'))
-                    sleep(HABITICA_REQUEST_WAIT_TIME)
-                todos = updated_task_list(todos, tids)
-        elif 'add' in args['<args>']:
-            ttext = ' '.join(args['<args>'][1:])
-            
-            hbt.tasks.user(type='todo',
-                       text=ttext,
-                       priority=PRIORITY[args['--dif']],
-                       date=args['--date'],
-                       _method='post')
-            todos.insert(0, {'completed': False, 'text': ttext})
-            print('added new todo \'%s\'' % ttext.encode('utf8'))
-        elif 'add_cl' in args['<args>']:
-            if args['--task'] == '-1':
-                raise ValueError('task id must be given after --task=')
-            else:
-                ttext = ' '.join(args['<args>'][1:])
-                tid = get_task_ids([args['--task']])[0]
-                hbt.tasks.checklist(type='todo',
-                           _id=todos[tid]['id'],
-                           text=ttext,
-                           _method='post')
-            if 'checklist' not in todos[tid]:
-                todos[tid]['checklist'] = []
-            todos[tid]['checklist'].insert(0, {'completed': False, 'text': ttext})
-        print_task_list(todos)
-
-    ##GET/POST pets
-    elif args['<command>'] == 'pet':
-        user = hbt.user()['data']
-        pets = user['items']['pets']
-        food = user['items']['food']
-        available_food = [key for key in food if food[key] != 0]
-        available_pet = [i for i,j in sorted(pets.items(), key = lambda x: x[1], reverse=True) if j !=-1 ]
-        if len(available_food) and len(available_pet):
-            first_pet = available_pet[0]
-            feeding_responese = input("Do you want to feed "+first_pet+"?[y/n] ")
-            if feeding_responese == 'y':
-                for item in available_food:
-                    pet_response = hbt.user.feed(_inventory1 = first_pet, _inventory2 = item, _method = 'post')
-                    print(pet_response['message'])
-            else:
-                print(colorprint("Ok, pets need more care, so try to feed them next time", RED))
-        else:
-            print("Oops, no food available")
-
-    ##GET/POST pets
-    elif args['<command>'] == 'egg':
-        user = hbt.user()['data']
-        pets = user['items']['pets']
-        eggs = user['items']['eggs']
-        potions = user['items']['hatchingPotions']
-        available_potions = [key for key in potions if potions[key] != 0]
-        available_eggs = [key for key in eggs if eggs[key] != 0]
-        possible_hatching = list(itertools.product(available_eggs, available_potions))
-        available_hatching = [i for i in possible_hatching if not pets.get(i[0]+"-"+i[1])]
-        if len(available_hatching):
-            hatching_responese = input("Do you want to hatch a "+available_hatching[0][1]+" "+available_hatching[0][0]+"? [y/n] ")
-            if hatching_responese == 'y':
-                hatch_response = hbt.user.hatch(_inventory1 = available_hatching[0][0], _inventory2 = available_hatching[0][1], _method = 'post')
-                print(hatch_response['message'])
-            else:
-                print(colorprint("Ok, you are so boring", RED))
-        else:
-            print("No egg can be hatched")
-
-    ##POST sleep
-    elif args['<command>'] == 'sleep':
-        user_status = hbt.user()['data']['preferences']['sleep']
-        if user_status:
-            print("You are sleeping!")
-            awake = input("Do you want to leave inn now?[y/n] ")
-            if awake == 'y': 
-                hbt.user.sleep(_method='post')
-                print("Work hard, so you can play harder!")
-            else: 
-                print("Ok, sleep tight!")
-        else:
-            sleeping = input("Do you want to sleep now?[y/n] ")
-            if sleeping == 'y': 
-                hbt.user.sleep(_method='post')
-                print("Have a nice dream :)")
-            else: 
-                print("Then continue your work, please!")
+    try:
+        COMMANDS[args['<command>']](hbt, args)
+        # the daemon replays --defer changes itself
+        if args['--defer'] and not from_daemon:
+            start_background_sync(account)
+    except Queued as e:
+        logging.error('Change not sent: %s' % e)
+    finally:
+        # release pooled keep-alive connections
+        if own_client:
+            hbt.close()
+        elif recorder is not None:
+            hbt.recorder = own_recorder
+        if args['--profile']:
+            recorder.summary()
+        if args['--trace']:
+            recorder.export(args['--trace'])
 
 if __name__ == '__main__':
-    cli()
\ No newline at end of file
+    cli()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Optional background daemon keeping an authenticated client warm.
+
+`habitica daemon` listens on a Unix socket and runs forwarded commands
+in-process with one long-lived api.Habitica client, so its auth,
+connection pool and rate limiter survive between invocations.
+`bin/habitica` tries `forward()` first and falls back to running the
+command itself when no daemon answers.
+
+This module is imported on every CLI start, so keep its imports light.
+"""
+
+
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+
+SOCKET_PATH = os.path.expanduser('~') + '/.config/habitica/daemon.sock'
+
+# commands that prompt, open a browser, manage the daemon or work with
+# files relative to the caller's directory run locally
+LOCAL_COMMANDS = ('home', 'pet', 'egg', 'sleep', 'daemon', 'export', 'import')
+LOCAL_SUBCOMMANDS = (('stats', 'export'),)
+JOURNAL_SYNC_INTERVAL = 60  # seconds between replays of queued changes
+PING_TIMEOUT = 2  # seconds a running daemon has to answer is_running
+
+
+def _recv_all(conn):
+    chunks = []
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+
+def _send(socket_path, request, timeout=None):
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(socket_path)
+        conn.sendall(json.dumps(request).encode('utf8') + b'\n')
+        conn.shutdown(socket.SHUT_WR)
+        return json.loads(_recv_all(conn).decode('utf8'))
+    finally:
+        conn.close()
+
+
+def caller_paths(argv):
+    """
+    `argv` with the --trace file made absolute (the daemon has a working
+    directory of its own), and the command words in it.
+    """
+    argv = list(argv)
+    commands = []
+    trace_file = False
+    for i, arg in enumerate(argv):
+        if trace_file:
+            argv[i] = os.path.abspath(arg)
+            trace_file = False
+        elif arg == '--trace':
+            trace_file = True
+        elif arg.startswith('--trace='):
+            argv[i] = '--trace=' + os.path.abspath(arg[len('--trace='):])
+        elif not arg.startswith('-'):
+            commands.append(arg)
+    return argv, commands
+
+
+def forward(argv, socket_path=SOCKET_PATH):
+    """
+    Run `argv` through a running daemon and print its output.
+
+    Returns the command's exit status, or None when the command has to
+    run locally (no daemon, or an interactive command).
+    """
+    argv, commands = caller_paths(argv)
+    if not commands or commands[0] in LOCAL_COMMANDS or \
+            tuple(commands[:2]) in LOCAL_SUBCOMMANDS:
+        return None
+    if any(arg.startswith('--account') for arg in argv):
+        return None  # the daemon acts as the default account only
+    if '--watch' in argv:
+        return None  # never finishes, so its output would never come back
+    if not os.path.exists(socket_path):
+        return None
+    try:
+        response = _send(socket_path, {'argv': argv})
+    except (socket.error, ValueError):
+        logging.debug('No daemon answering on %s' % socket_path)
+        return None
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+def is_running(socket_path=SOCKET_PATH):
+    """Whether a daemon answers on `socket_path` (a killed one leaves it)."""
+    if not os.path.exists(socket_path):
+        return False
+    try:
+        _send(socket_path, {'ping': True}, timeout=PING_TIMEOUT)
+    except (socket.error, ValueError):
+        return False
+    return True
+
+
+def stop(socket_path=SOCKET_PATH):
+    """Ask a running daemon to exit."""
+    try:
+        _send(socket_path, {'stop': True})
+    except (socket.error, ValueError):
+        print('No habitica daemon running')
+    else:
+        print('Stopped habitica daemon')
+
+
+def run_command(argv, hbt, from_daemon=False):
+    """
+    Run one CLI command with `hbt`, capturing its output and status;
+    `from_daemon` when the daemon runs it for a caller.
+    """
+    from contextlib import redirect_stderr, redirect_stdout
+    from io import StringIO
+    from . import core
+
+    stdout, stderr = StringIO(), StringIO()
+    status = 0
+    # the command's log messages go back to the caller as well
+    handler = logging.StreamHandler(stderr)
+    logging.getLogger().addHandler(handler)
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            core.cli(argv, hbt=hbt, from_daemon=from_daemon)
+        except SystemExit as e:
+            if isinstance(e.code, int):
+                status = e.code
+            elif e.code is not None:
+                stderr.write('%s\n' % e.code)
+                status = 1
+        except Exception as e:
+            logging.exception('Command %r failed' % argv)
+            stderr.write('%s: %s\n' % (type(e).__name__, e))
+            status = 1
+        finally:
+            logging.getLogger().removeHandler(handler)
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+            'status': status}
+
+
+def sync_loop(hbt, wake, stopping):
+    """Replay the journal periodically, or as soon as `wake` is set."""
+    from . import core, journal
+
+    while True:
+        wake.wait(JOURNAL_SYNC_INTERVAL)
+        wake.clear()
+        if stopping.is_set():
+            return
+        try:
+            core.open_journal().sync(hbt)
+        except journal.SyncRunning:
+            pass  # the other process sends them
+        except Exception as e:
+            logging.error('Background sync failed: %s' % e)
+
+
+def serve(hbt, socket_path=SOCKET_PATH):
+    """Answer forwarded commands one at a time until asked to stop."""
+    # configure logging now, so commands' basicConfig calls don't bind
+    # handlers to a captured stream
+    logging.basicConfig()
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    old_umask = os.umask(0o077)  # the socket acts with the user's API key
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(old_umask)
+    server.listen(16)
+    print('habitica daemon listening on %s' % socket_path)
+
+    wake, stopping = threading.Event(), threading.Event()
+    syncer = threading.Thread(target=sync_loop, args=(hbt, wake, stopping))
+    syncer.daemon = True
+    syncer.start()
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            try:
+                request = json.loads(_recv_all(conn).decode('utf8'))
+                if request.get('stop'):
+                    conn.sendall(b'{}')
+                    break
+                if request.get('ping'):
+                    conn.sendall(b'{}')
+                    continue
+                response = run_command(request['argv'], hbt,
+                                       from_daemon=True)
+                conn.sendall(json.dumps(response).encode('utf8'))
+                if '--defer' in request['argv']:
+                    wake.set()
+            except (socket.error, ValueError, KeyError) as e:
+                logging.error('Bad daemon request: %s' % e)
+            finally:
+                conn.close()
+    finally:
+        stopping.set()
+        wake.set()
+        syncer.join()
+        server.close()
+        os.remove(socket_path)
+        hbt.close()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Fleet mode: one command across many accounts.
+
+`habitica --account=all status` (or --account=alice,bob) runs the
+command for each auth.cfg profile in a pool of worker processes. Every
+worker builds its own client, so each account gets its own connection
+pool and its own rate limiter. Outputs are captured and printed in
+profile order, each under a header naming its profile.
+"""
+
+
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+FLEET_WORKERS = 8  # accounts served at once
+# commands that can't sensibly run for several accounts at once
+FLEET_EXCLUDED = ('home', 'daemon', 'export', 'import')
+# commands that ask before acting, see core.confirm
+FLEET_PROMPTING = ('pet', 'egg', 'sleep')
+
+
+def run_profile(profile, argv):
+    """Run `argv` as `profile` (in a worker); returns daemon.run_command's dict."""
+    from . import api, core, daemon
+
+    auth = core.load_auth(core.AUTH_CONF, profile)
+    with api.Habitica(auth=auth) as hbt:
+        return daemon.run_command(argv + ['--account=%s' % profile], hbt)
+
+
+def without_account(argv):
+    """`argv` minus its --account option."""
+    stripped = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--account':
+            skip = True
+        elif not arg.startswith('--account='):
+            stripped.append(arg)
+    return stripped
+
+
+def select_profiles(selection, available):
+    """Profiles named by an --account value ('all' or a comma list)."""
+    if selection == 'all':
+        return list(available)
+    profiles = [name.strip() for name in selection.split(',') if name.strip()]
+    unknown = [name for name in profiles if name not in available]
+    if unknown:
+        raise ValueError('unknown account(s): %s' % ', '.join(unknown))
+    return profiles
+
+
+def run(argv, profiles, workers=FLEET_WORKERS):
+    """
+    Run `argv` (without --account) for every profile, print the outputs
+    in profile order and return the worst exit status.
+    """
+    from . import core
+
+    status = 0
+    workers = max(1, min(workers, len(profiles)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(run_profile, profiles, [argv] * len(profiles))
+        for profile, result in zip(profiles, results):
+            print(core.colorprint('== %s ==' % profile, core.GREEN))
+            sys.stdout.write(result['stdout'])
+            sys.stderr.write(result['stderr'])
+            sys.stdout.flush()
+            status = max(status, result['status'])
+    return status
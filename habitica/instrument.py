@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Request-level instrumentation for `--profile` and `--trace`.
+
+A Recorder handed to api.Habitica collects one record per HTTP request
+(every retry counts): method, route template, status, time spent waiting
+for the rate limiter, DNS/connect/TLS setup, time to first byte, body
+transfer, body bytes on the wire and JSON decode time, all in seconds.
+
+Connection setup is only visible inside urllib3, so a profiled client
+mounts TimedAdapter, whose connection classes note their DNS, connect
+and TLS times for the request being sent on the current thread. None of
+this module is imported, and no timer is read, unless profiling is on.
+"""
+
+
+import json
+import sys
+import threading
+import time
+from socket import SOCK_STREAM, getaddrinfo, gaierror
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+TIMING_FIELDS = ('throttle', 'dns', 'connect', 'tls', 'ttfb', 'transfer',
+                 'decode', 'total')
+
+_local = threading.local()
+
+
+def _note(name, seconds):
+    timings = getattr(_local, 'timings', None)
+    if timings is not None:
+        timings[name] += seconds
+
+
+class _TimedConnectionMixin(object):
+
+    def _new_conn(self):
+        # resolve here, so DNS and TCP connect can be told apart
+        start = time.perf_counter()
+        dns_host = self._dns_host
+        try:
+            address = getaddrinfo(dns_host, self.port, 0, SOCK_STREAM)[0][4][0]
+        except (gaierror, IndexError):
+            address = None  # let urllib3 fail (and report) as usual
+        resolved = time.perf_counter()
+        _note('dns', resolved - start)
+        if address is not None:
+            self._dns_host = address
+        try:
+            return super(_TimedConnectionMixin, self)._new_conn()
+        finally:
+            self._dns_host = dns_host
+            _note('connect', time.perf_counter() - resolved)
+
+    def connect(self):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return super(_TimedConnectionMixin, self).connect()
+        start = time.perf_counter()
+        setup = timings['dns'] + timings['connect']
+        super(_TimedConnectionMixin, self).connect()
+        # whatever connect() spent beyond _new_conn is the TLS handshake
+        spent = time.perf_counter() - start
+        timings['tls'] += max(
+            spent - (timings['dns'] + timings['connect'] - setup), 0.0)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """An HTTPAdapter whose new connections report their setup times."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimedAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TimedHTTPConnectionPool,
+            'https': TimedHTTPSConnectionPool,
+        }
+
+
+class Recorder(object):
+    """Collects request records for one command."""
+
+    def __init__(self, command=None):
+        self.command = command
+        self.records = []
+        self.started = time.time()
+        self.lock = threading.Lock()
+
+    def start(self, queued):
+        """
+        Call right before sending a request, with the perf_counter() value
+        from before waiting for the rate limiter; pass the result to finish.
+        """
+        sent = time.perf_counter()
+        _local.timings = {'dns': 0.0, 'connect': 0.0, 'tls': 0.0}
+        return {'throttle': sent - queued, 'sent': sent,
+                'timings': _local.timings}
+
+    def finish(self, started, method, route, status, res=None):
+        """Record a request sent after start(); `res` if one came back."""
+        total = time.perf_counter() - started['sent']
+        timings = started['timings']
+        fields = dict(timings, throttle=started['throttle'], total=total)
+        if res is not None:
+            # requests measures up to the parsed headers; unless streamed,
+            # the body has been downloaded by the time we get here
+            headers = res.elapsed.total_seconds()
+            setup = timings['dns'] + timings['connect'] + timings['tls']
+            fields['ttfb'] = max(headers - setup, 0.0)
+            if res.raw is not None and res._content_consumed:
+                fields['transfer'] = max(total - headers, 0.0)
+                fields['bytes'] = res.raw.tell()
+        return self.record(method, route, status, **fields)
+
+    def record(self, method, route, status, **timings):
+        """Add a request record; the caller may fill in more fields later."""
+        record = dict(dict.fromkeys(TIMING_FIELDS),
+                      method=method.upper(), route=route, status=status,
+                      bytes=None, time=time.time())
+        record.update(timings)
+        with self.lock:
+            self.records.append(record)
+        return record
+
+    def summary(self, stream=None, wall=None):
+        """Print totals per route (times in ms), then the command's totals."""
+        stream = stream or sys.stderr
+        routes = {}
+        for record in self.records:
+            key = (record['method'], record['route'])
+            routes.setdefault(key, []).append(record)
+
+        columns = ('throttle', 'dns', 'connect', 'tls', 'ttfb', 'transfer',
+                   'decode')
+        stream.write('%-6s %-36s %5s %-9s' % ('method', 'route', 'count',
+                                              'status'))
+        stream.write(''.join(' %8s' % column for column in columns))
+        stream.write(' %9s\n' % 'KiB')
+        for (method, route), records in routes.items():
+            statuses = sorted(set(str(r['status']) for r in records))
+            stream.write('%-6s %-36s %5d %-9s' % (method, route, len(records),
+                                                  ','.join(statuses)))
+            for column in columns:
+                stream.write(' %8.1f' % (1000 * sum(r[column] or 0.0
+                                                    for r in records)))
+            stream.write(' %9.1f\n' % (sum(r['bytes'] or 0 for r in records)
+                                       / 1024.0))
+        if wall is None:
+            wall = time.time() - self.started
+        stream.write('%s: %d requests, %.1f KiB received, %.1f ms in '
+                     'requests, %.1f ms wall\n' % (
+                         self.command or 'habitica', len(self.records),
+                         sum(r['bytes'] or 0 for r in self.records) / 1024.0,
+                         1000 * sum(r['total'] or 0.0 for r in self.records),
+                         1000 * wall))
+
+    def export(self, path):
+        """Append the records to `path` as JSON lines."""
+        with open(path, 'a') as f:
+            for record in self.records:
+                f.write(json.dumps(dict(record, command=self.command)) + '\n')
@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Write-ahead journal for mutating API calls.
+
+Every score/create/feed/hatch call is appended to a JSON-lines journal
+before it is sent, and acknowledged once the server accepted it. Calls
+the server can't have acted on (the connection failed, or it answered
+429/503) stay pending and are replayed by `habitica sync`, by a
+`--defer`red command's background sync, or by the daemon, each
+replaying the calls of its own account. Other failures, such as a read
+timeout, drop the call: it may have been applied already. Each call
+carries an idempotency key that ties its records together; it is also
+sent as the Idempotency-Key header.
+
+Journal records, one JSON object per line:
+
+    {"op": "call", "key": ..., "path": ["tasks", "score"], "kwargs": {...},
+     "coalesce": null | "dedupe" | "toggle", "user": ..., "time": ...}
+    {"op": "ack", "key": ...}
+    {"op": "fail", "key": ..., "error": "..."}
+    {"op": "drop", "key": ..., "reason": "..."}
+"""
+
+
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking on this platform
+    fcntl = None
+
+JOURNAL_MAX_ATTEMPTS = 5
+JOURNAL_COMPACT_SIZE = 64 * 1024  # bytes; submit compacts a larger journal
+DEFERRED = object()  # what submit returns for a call it only journaled
+
+
+class Queued(Exception):
+    """The call could not be sent now; it stays in the journal."""
+
+
+class SyncRunning(Exception):
+    """Another process is replaying the account's journal right now."""
+
+
+def is_retryable(error):
+    """
+    Whether a failed call is safe to send again: only when the server
+    can't have acted on it, like api.Habitica retries writes. Habitica
+    ignores the Idempotency-Key header, so a score that timed out may
+    well have counted.
+    """
+    import requests
+    from .api import CircuitOpenError, never_sent
+
+    if isinstance(error, CircuitOpenError):
+        return True  # nothing was sent
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return never_sent(error)
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in (429, 503)
+    return False
+
+
+def is_transient(error):
+    """Network trouble, rate limiting and server errors."""
+    import requests
+
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+def endpoint_user(endpoint):
+    return (endpoint.auth or {}).get('x-api-user')
+
+
+def endpoint_path(endpoint):
+    return list(endpoint.path)
+
+
+class Journal(object):
+    """
+    Append-only journal of mutating calls, shared by every habitica process
+    of the user (appends and compaction are serialized with flock).
+    Compaction rewrites the journal with the pending calls only; submit
+    runs it once the journal outgrows JOURNAL_COMPACT_SIZE, sync always.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def _locked(self, mode, func):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        # the lock lives in a file of its own: compaction replaces the journal
+        with self.lock:
+            with open(self.path + '.lock', 'a') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    with open(self.path, mode) as f:
+                        return func(f)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _append(self, record):
+        def write(f):
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._locked('a', write)
+
+    @staticmethod
+    def _parse(f):
+        records = []
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:  # torn write at the end of the file
+                logging.debug('Skipping corrupt journal line %r' % line)
+        return records
+
+    @staticmethod
+    def _pending(records):
+        calls = {}
+        for record in records:
+            key = record['key']
+            if record['op'] == 'call':
+                calls[key] = dict(record, attempts=0)
+            elif record['op'] == 'fail' and key in calls:
+                calls[key]['attempts'] += 1
+            elif record['op'] in ('ack', 'drop'):
+                calls.pop(key, None)
+        return list(calls.values())
+
+    def pending(self, user=None):
+        """
+        Calls neither acknowledged nor dropped, in journal order; only
+        those made as `user` (and older ones not saying) if given.
+        """
+        if not os.path.exists(self.path):
+            return []
+        calls = self._pending(self._locked('r', self._parse))
+        if user is None:
+            return calls
+        return [call for call in calls if call.get('user') in (None, user)]
+
+    def record(self, endpoint, kwargs, coalesce=None):
+        """Journal a call to `endpoint` and return its idempotency key."""
+        key = str(uuid.uuid4())
+        self._append({'op': 'call', 'key': key,
+                      'path': endpoint_path(endpoint), 'kwargs': kwargs,
+                      'coalesce': coalesce, 'user': endpoint_user(endpoint),
+                      'time': time.time()})
+        return key
+
+    def send(self, endpoint, key, kwargs):
+        """
+        Send a journaled call. Raises Queued if it should be retried later;
+        other errors drop the call from the journal and are re-raised.
+        """
+        try:
+            result = endpoint(_headers={'Idempotency-Key': key}, **kwargs)
+        except Exception as e:
+            if is_retryable(e):
+                self._append({'op': 'fail', 'key': key, 'error': str(e)})
+                raise Queued('queued for `habitica sync` (%s)' % e)
+            self._append({'op': 'drop', 'key': key, 'reason': str(e)})
+            if is_transient(e):
+                logging.warning('Not sending %s again: the server may have '
+                                'applied it already (%s)'
+                                % ('/'.join(endpoint_path(endpoint)), e))
+            raise
+        self._append({'op': 'ack', 'key': key})
+        return result
+
+    def submit(self, endpoint, coalesce=None, defer=False, **kwargs):
+        """
+        Journal and send a call to `endpoint` with `kwargs`. With `defer`
+        the call is only journaled and DEFERRED is returned.
+
+        `coalesce` tells sync how repeated identical calls combine:
+        'dedupe' (once is enough, e.g. completing a todo) or 'toggle'
+        (pairs cancel out, e.g. checklist items).
+        """
+        key = self.record(endpoint, kwargs, coalesce)
+        if defer:
+            return DEFERRED
+        result = self.send(endpoint, key, kwargs)
+        # settled calls pile up unless someone runs sync: keep it bounded
+        try:
+            large = os.path.getsize(self.path) > JOURNAL_COMPACT_SIZE
+        except OSError:
+            large = False
+        if large:
+            self.compact()
+        return result
+
+    def coalesce(self, entries):
+        """
+        Drop pending calls made redundant by identical ones. Only calls
+        that follow each other on the same task (or checklist item)
+        combine: done, undo, done on a daily must replay as such.
+        """
+        last = {}  # target -> kept coalescible calls on it, last one on top
+        dropped = set()
+        for entry in entries:
+            kwargs = entry['kwargs']
+            target = json.dumps([entry['path'][0], kwargs.get('_id'),
+                                 kwargs.get('_cid')])
+            calls = last.setdefault(target, [])
+            if not entry.get('coalesce'):
+                calls.append(None)  # nothing combines across this call
+                continue
+            ident = json.dumps([entry['path'], kwargs], sort_keys=True)
+            previous = calls[-1] if calls else None
+            if previous is None or previous[0] != ident:
+                calls.append((ident, entry))
+                continue
+            redundant = [entry]
+            if entry['coalesce'] == 'toggle':
+                redundant.append(previous[1])  # the pair cancels out
+                calls.pop()
+            for call in redundant:
+                self._append({'op': 'drop', 'key': call['key'],
+                              'reason': 'coalesced'})
+                dropped.add(call['key'])
+        return [entry for entry in entries if entry['key'] not in dropped]
+
+    def sync(self, hbt):
+        """
+        Replay the pending calls of `hbt`'s account in order. Returns the
+        number of calls sent and the number still pending.
+
+        One process replays an account at a time (a --defer command
+        starts a sync of its own, the daemon syncs too): raises
+        SyncRunning if another one is at it. That one picks up calls
+        journaled while it runs.
+        """
+        user = endpoint_user(hbt)
+        lock_path = '%s.%s.sync' % (self.path, user)
+        directory = os.path.dirname(lock_path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        sent = 0
+        seen = set()
+        while True:
+            with open(lock_path, 'a') as lock:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except (IOError, OSError):
+                        if seen:
+                            break  # another sync took over
+                        raise SyncRunning('another habitica process is '
+                                          'sending the queued changes')
+                try:
+                    sent += self._replay(hbt, user, seen)
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock, fcntl.LOCK_UN)
+            # calls journaled just before the lock was released
+            if all(entry['key'] in seen for entry in self.pending(user)):
+                break
+        self.compact()
+        return sent, len(self.pending(user))
+
+    def _replay(self, hbt, user, seen):
+        """Send the pending calls of `user` until one is Queued again."""
+        sent = 0
+        while True:
+            entries = [entry for entry in self.pending(user)
+                       if entry['key'] not in seen]
+            if not entries:
+                return sent
+            seen.update(entry['key'] for entry in entries)
+            for entry in self.coalesce(self.pending(user)):
+                if entry['attempts'] >= JOURNAL_MAX_ATTEMPTS:
+                    logging.warning('Giving up on %s after %d attempts'
+                                    % ('/'.join(entry['path']),
+                                       entry['attempts']))
+                    self._append({'op': 'drop', 'key': entry['key'],
+                                  'reason': 'too many attempts'})
+                    continue
+                endpoint = hbt
+                for name in entry['path']:
+                    endpoint = getattr(endpoint, name)
+                try:
+                    self.send(endpoint, entry['key'], dict(entry['kwargs']))
+                    sent += 1
+                except Queued:
+                    # the server is still unreachable, keep the order intact
+                    return sent
+                except Exception as e:
+                    logging.error('Dropped %s: %s'
+                                  % ('/'.join(entry['path']), e))
+
+    def compact(self):
+        """Drop the records of settled calls, keeping the pending ones."""
+        def rewrite(f):
+            records = self._parse(f)
+            pending = set(call['key'] for call in self._pending(records))
+            kept = [record for record in records if record['key'] in pending]
+            if len(kept) == len(records):
+                return
+            temp = self.path + '.tmp'
+            with open(temp, 'w') as out:
+                out.writelines(json.dumps(record) + '\n' for record in kept)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temp, self.path)
+        if os.path.exists(self.path):
+            self._locked('r', rewrite)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Feed and hatch planning over the whole inventory.
+
+The inventory is indexed once and turned into a plan: which egg to
+hatch with which potion, and which food to give each pet in what
+amount. Foods whose target matches the pet's potion (worth 5 points
+instead of 2) are handed out first, to the pets they match; whatever is
+left then goes to the pets that still need it. No pet is fed past the
+50 points that turn it into a mount, and each (pet, food) pair costs a
+single request thanks to the feed endpoint's `amount` parameter.
+"""
+
+
+from collections import namedtuple
+
+MOUNT_AT = 50  # feeding points that turn a pet into a mount
+HATCHED_AT = 5  # feeding points of a freshly hatched pet
+MATCHING_FOOD_POINTS = 5
+OTHER_FOOD_POINTS = 2
+KEPT_FOODS = ('Saddle',)  # instantly raises a mount: never planned
+
+Hatch = namedtuple('Hatch', ['egg', 'potion'])
+Feed = namedtuple('Feed', ['pet', 'food', 'amount', 'points', 'mount'])
+
+
+def ceil_div(a, b):
+    return -(-a // b)
+
+
+class Inventory(object):
+    """
+    A user's pets, food, eggs and potions, with what /content says about
+    them: which food matches which potion and which pets exist.
+
+    `store` is a content.ContentStore; `items` the user's `items`.
+    """
+
+    def __init__(self, items, store):
+        self.pets = dict(items.get('pets') or {})
+        self.food = dict((key, count) for key, count
+                         in (items.get('food') or {}).items()
+                         if count > 0 and key not in KEPT_FOODS)
+        self.eggs = dict((key, count) for key, count
+                         in (items.get('eggs') or {}).items() if count > 0)
+        self.potions = dict((key, count) for key, count
+                            in (items.get('hatchingPotions') or {}).items()
+                            if count > 0)
+        self.food_target = dict(
+            (key, store.get('food', key, {}).get('target'))
+            for key in self.food)
+        self.pet_names = set(store.keys('petInfo'))
+        self.special_pets = set(store.keys('specialPets'))
+
+    @staticmethod
+    def potion_of(pet):
+        return pet.split('-', 1)[1] if '-' in pet else None
+
+    def feedable(self, pet):
+        """A hatched pet (not a mount yet) that accepts food."""
+        value = self.pets.get(pet) or 0
+        return 0 < value < MOUNT_AT and pet not in self.special_pets
+
+    def hatchable(self, egg, potion):
+        pet = '%s-%s' % (egg, potion)
+        # a pet that was raised to a mount (-1) can be hatched again
+        return (self.pets.get(pet) or 0) <= 0 and (
+            not self.pet_names or pet in self.pet_names)
+
+
+def plan_hatches(inventory):
+    """
+    Hatch every pet the eggs and potions allow, using the most plentiful
+    ones first. The new pets are added to `inventory`, so a feed plan
+    made afterwards covers them too.
+    """
+    hatches = []
+    for egg in sorted(inventory.eggs, key=inventory.eggs.get, reverse=True):
+        for potion in sorted(inventory.potions, key=inventory.potions.get,
+                             reverse=True):
+            if not inventory.eggs[egg]:
+                break
+            if inventory.potions[potion] and inventory.hatchable(egg, potion):
+                hatches.append(Hatch(egg, potion))
+                inventory.eggs[egg] -= 1
+                inventory.potions[potion] -= 1
+                inventory.pets['%s-%s' % (egg, potion)] = HATCHED_AT
+    return hatches
+
+
+def _give(inventory, pet, food, points_each, feeds):
+    """Feed `pet` as much `food` as it takes to reach MOUNT_AT."""
+    needed = MOUNT_AT - inventory.pets[pet]
+    amount = min(inventory.food[food], ceil_div(needed, points_each))
+    if amount <= 0:
+        return
+    inventory.food[food] -= amount
+    inventory.pets[pet] = min(inventory.pets[pet] + amount * points_each,
+                              MOUNT_AT)
+    feeds.append(Feed(pet, food, amount, amount * points_each,
+                      inventory.pets[pet] >= MOUNT_AT))
+
+
+def plan_feeds(inventory):
+    """
+    Feed plan for every feedable pet, closest to a mount first: matching
+    food first, then leftovers. Returns Feed records in execution order.
+    """
+    pets = sorted((pet for pet in inventory.pets if inventory.feedable(pet)),
+                  key=lambda pet: inventory.pets[pet], reverse=True)
+    matching = {}
+    for food, target in inventory.food_target.items():
+        if target:
+            matching.setdefault(target, []).append(food)
+
+    feeds = []
+    # matching food, the most plentiful kind first (fewer requests)
+    for pet in pets:
+        foods = matching.get(inventory.potion_of(pet), [])
+        for food in sorted(foods, key=inventory.food.get, reverse=True):
+            if inventory.pets[pet] < MOUNT_AT:
+                _give(inventory, pet, food, MATCHING_FOOD_POINTS, feeds)
+    # then whatever no pet needed as matching food
+    for pet in pets:
+        for food in sorted(inventory.food, key=inventory.food.get,
+                           reverse=True):
+            if inventory.pets[pet] < MOUNT_AT and inventory.food[food] and \
+                    inventory.food_target.get(food) != inventory.potion_of(pet):
+                _give(inventory, pet, food, OTHER_FOOD_POINTS, feeds)
+    return feeds
+
+
+def group_by_pet(feeds):
+    """Feeds per pet, in plan order: one pet's feeds must not overlap."""
+    groups = {}
+    order = []
+    for feed in feeds:
+        if feed.pet not in groups:
+            order.append(feed.pet)
+        groups.setdefault(feed.pet, []).append(feed)
+    return [groups[pet] for pet in order]
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+The Habitica v3 endpoints the CLI calls, as a declarative route table.
+
+Each endpoint path (the attribute chain of ``hbt.tasks.score``) has one
+or more URI templates. A template's `:name` parameters are filled from
+the call's `_name` keyword arguments, converted by the parameter's type,
+and the first template whose parameters are all given is used. Templates
+are compiled once, into a %-format string and the parameters it takes,
+so building a URI is a single formatting operation.
+
+Paths missing from the table still work: they map to a template of the
+same name without parameters.
+"""
+
+
+import re
+from urllib.parse import quote
+
+_PLAIN = re.compile(r'[\w.~-]+\Z', re.ASCII)  # needs no quoting
+
+
+def segment(value):
+    """A path segment (an id or an item key), URL-quoted."""
+    if not isinstance(value, str):
+        value = str(value)
+    if _PLAIN.match(value) is not None:
+        return value
+    if not value:
+        raise ValueError('empty path segment')
+    return quote(value, safe='')
+
+
+def direction(value):
+    """A score direction."""
+    if value not in ('up', 'down'):
+        raise ValueError("direction must be 'up' or 'down', not %r" % value)
+    return value
+
+
+# parameter name -> type
+PARAM_TYPES = {
+    'id': segment,
+    'cid': segment,
+    'direction': direction,
+    'inventory1': segment,
+    'inventory2': segment,
+}
+
+# (endpoint path, URI template), most specific template first
+ROUTES = [
+    ('status', '/status'),
+    ('content', '/content'),
+    ('tags', '/tags'),
+    ('user', '/user'),
+    ('user.sleep', '/user/sleep'),
+    ('user.feed', '/user/feed/:inventory1/:inventory2'),
+    ('user.hatch', '/user/hatch/:inventory1/:inventory2'),
+    ('groups.party', '/groups/party'),
+    ('tasks.user', '/tasks/user'),
+    ('tasks.score', '/tasks/:id/score/:direction'),
+    ('tasks.score', '/tasks/:id/score'),
+    ('tasks.checklist', '/tasks/:id/checklist'),
+    ('tasks.checklist.score', '/tasks/:id/checklist/:cid/score'),
+]
+
+
+class Route(object):
+    """A compiled URI template, e.g. /tasks/:id/score/:direction."""
+
+    __slots__ = ('template', 'format', 'params', 'kwargs', 'types',
+                 'converters')
+
+    def __init__(self, template):
+        self.template = template
+        parts = template.split('/')
+        self.params = tuple(part[1:] for part in parts if part.startswith(':'))
+        self.kwargs = tuple('_' + name for name in self.params)
+        self.types = tuple(PARAM_TYPES.get(name, segment)
+                           for name in self.params)
+        self.converters = tuple(zip(self.types, self.kwargs))
+        self.format = '/'.join('%s' if part.startswith(':')
+                               else part.replace('%', '%%') for part in parts)
+
+    def __repr__(self):
+        return '<Route %s>' % self.template
+
+    def matches(self, kwargs):
+        """Whether a call's `kwargs` give every param (as `_<param>`)."""
+        for kwarg in self.kwargs:
+            if kwargs.get(kwarg) is None:
+                return False
+        return True
+
+    def build(self, kwargs):
+        """The URI path, with the params taken from a call's `kwargs`."""
+        if not self.params:
+            return self.format
+        return self.format % tuple([convert(kwargs[kwarg]) for convert, kwarg
+                                    in self.converters])
+
+
+def compile_routes(table):
+    """{path tuple: [Route, ...]} of a (path, template) table."""
+    compiled = {}
+    for path, template in table:
+        compiled.setdefault(tuple(path.split('.')), []).append(Route(template))
+    return compiled
+
+
+COMPILED = compile_routes(ROUTES)
+
+
+def lookup(path):
+    """The routes of an endpoint path, given as a tuple of names."""
+    routes = COMPILED.get(path)
+    if routes is None:
+        routes = [Route('/' + '/'.join(path))]
+    return routes
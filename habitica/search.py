@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Full-text search over tasks, kept in a single SQLite file.
+
+The index is inverted: a postings table maps every word of a task's
+text, notes and checklist items (and the ids of its tags) to the tasks
+containing it, weighted by the field it came from. Each task list of
+each account is indexed as it is fetched or changed; tasks whose
+indexed fields are unchanged are skipped, so keeping the index current
+costs a single SELECT when nothing changed.
+
+Queries match every one of their words, whole or as a prefix (at half
+weight), and rank tasks by tf-idf. Words that start the name of one of
+the account's tags also match the tasks carrying that tag.
+"""
+
+
+import hashlib
+import math
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+SEARCH_BUSY_TIMEOUT = 10  # seconds to wait for another process' transaction
+FIELD_WEIGHTS = {'text': 3.0, 'tags': 2.0, 'checklist': 1.0, 'notes': 1.0}
+PREFIX_FACTOR = 0.5  # a word matched by its prefix only counts half
+TAG_TERM = '#'  # tags are indexed as '#<tag id>', which no word can be
+INDEXED_FIELDS = ('id', 'text', 'notes', 'tags', 'checklist')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    list TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    sig TEXT NOT NULL,
+    UNIQUE (account, task_id)
+);
+CREATE INDEX IF NOT EXISTS docs_list ON docs (account, list);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    doc INTEGER NOT NULL,
+    weight REAL NOT NULL,
+    PRIMARY KEY (term, doc)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+CREATE TABLE IF NOT EXISTS tags (
+    account TEXT NOT NULL,
+    tag_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    PRIMARY KEY (account, tag_id)
+);
+"""
+
+_WORD = re.compile(r'\w+', re.UNICODE)
+_LAST = u'\uffff'  # sorts after any word: [prefix, prefix + _LAST) is a range
+
+Match = namedtuple('Match', ['score', 'list', 'position', 'task_id', 'text'])
+
+
+def tokenize(text):
+    """The lower-cased words of `text`."""
+    return _WORD.findall((text or '').lower())
+
+
+def document(task, task_list):
+    """
+    The indexed form of a task dict of `task_list`: its id, text, a
+    signature of everything indexed and its weighted terms.
+    """
+    terms = {}
+    fields = [('text', task.get('text')), ('notes', task.get('notes'))]
+    fields += [('checklist', item.get('text'))
+               for item in task.get('checklist') or ()]
+    for field, text in fields:
+        for word in tokenize(text):
+            terms[word] = terms.get(word, 0.0) + FIELD_WEIGHTS[field]
+    for tag in task.get('tags') or ():
+        terms[TAG_TERM + tag] = FIELD_WEIGHTS['tags']
+    sig = hashlib.sha1(repr((task_list, task.get('text'),
+                             sorted(terms.items()))).encode('utf8'))
+    return task.get('id'), task.get('text') or '', sig.hexdigest(), terms
+
+
+class SearchIndex(object):
+    """
+    The inverted index of every account's task lists.
+
+        index = SearchIndex(path)
+        index.update(account, 'todos', task_dicts)
+        index.search(account, 'milk', ['todos'])
+    """
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.path = path
+        self.db = sqlite3.connect(path, timeout=SEARCH_BUSY_TIMEOUT,
+                                  isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(SCHEMA)
+
+    def update(self, account, task_list, tasks):
+        """
+        Make the index of `task_list` match `tasks` (task dicts in display
+        order): changed tasks are reindexed, vanished ones dropped.
+        Returns the number of tasks reindexed.
+        """
+        known = dict((task_id, (doc, position, sig)) for doc, task_id, position,
+                     sig in self.db.execute(
+                         'SELECT doc, task_id, position, sig FROM docs '
+                         'WHERE account=? AND list=?', (account, task_list)))
+        changed = []
+        moved = []
+        for position, task in enumerate(tasks, 1):
+            task_id, text, sig, terms = document(task, task_list)
+            old = known.pop(task_id, None)
+            if old is None or old[2] != sig:
+                changed.append((task_id, position, text, sig, terms))
+            elif old[1] != position:
+                moved.append((position, old[0]))
+        if not (changed or moved or known):
+            return 0
+
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            gone = [(doc,) for doc, _, _ in known.values()]
+            cursor.executemany('DELETE FROM postings WHERE doc=?', gone)
+            cursor.executemany('DELETE FROM docs WHERE doc=?', gone)
+            cursor.executemany('UPDATE docs SET position=? WHERE doc=?', moved)
+            for task_id, position, text, sig, terms in changed:
+                cursor.execute(
+                    'INSERT INTO docs (account, list, task_id, position, '
+                    'text, sig) VALUES (?, ?, ?, ?, ?, ?) '
+                    'ON CONFLICT (account, task_id) DO UPDATE SET '
+                    'list=excluded.list, position=excluded.position, '
+                    'text=excluded.text, sig=excluded.sig',
+                    (account, task_list, task_id, position, text, sig))
+                doc = cursor.execute(
+                    'SELECT doc FROM docs WHERE account=? AND task_id=?',
+                    (account, task_id)).fetchone()[0]
+                cursor.execute('DELETE FROM postings WHERE doc=?', (doc,))
+                cursor.executemany(
+                    'INSERT INTO postings VALUES (?, ?, ?)',
+                    [(term, doc, weight) for term, weight in terms.items()])
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+        return len(changed)
+
+    def unknown_tags(self, account):
+        """Ids of tags on indexed tasks whose names set_tags wasn't told."""
+        rows = self.db.execute(
+            'SELECT DISTINCT substr(p.term, 2) FROM postings p '
+            'JOIN docs d ON d.doc = p.doc '
+            'WHERE p.term >= ? AND p.term < ? AND d.account=? '
+            'AND substr(p.term, 2) NOT IN '
+            '(SELECT tag_id FROM tags WHERE account=?)',
+            (TAG_TERM, TAG_TERM + _LAST, account, account))
+        return [row[0] for row in rows]
+
+    def set_tags(self, account, tags):
+        """Remember the account's tag names, `tags` being {id: name}."""
+        cursor = self.db.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute('DELETE FROM tags WHERE account=?', (account,))
+            cursor.executemany('INSERT INTO tags VALUES (?, ?, ?)',
+                               [(account, tag_id, name)
+                                for tag_id, name in tags.items()])
+        except Exception:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+
+    def _postings(self, account, lists, lower, upper):
+        scope = 'd.account=?'
+        params = [lower, upper, account]
+        if lists:
+            scope += ' AND d.list IN (%s)' % ','.join('?' * len(lists))
+            params += list(lists)
+        return self.db.execute(
+            'SELECT p.term, p.doc, p.weight FROM postings p '
+            'JOIN docs d ON d.doc = p.doc '
+            'WHERE p.term >= ? AND p.term < ? AND ' + scope, params)
+
+    def search(self, account, query, lists=None, limit=None):
+        """
+        Tasks of `account` (in `lists`, or all) matching every word of
+        `query`, best first, as Match records; positions are 1-based.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        tags = list(self.db.execute(
+            'SELECT tag_id, name FROM tags WHERE account=?', (account,)))
+
+        total = self._count(account, lists)
+        scores = None
+        for word in words:
+            rows = list(self._postings(account, lists, word, word + _LAST))
+            for tag_id, name in tags:
+                if any(part.startswith(word) for part in tokenize(name)):
+                    term = TAG_TERM + tag_id
+                    rows += self._postings(account, lists, term, term + '\0')
+            # a word's idf counts every task it matches, whole or as prefix
+            idf = math.log(1.0 + float(total) /
+                           max(len(set(doc for _, doc, _ in rows)), 1))
+            word_scores = {}
+            for term, doc, weight in rows:
+                score = weight * idf
+                if term != word and not term.startswith(TAG_TERM):
+                    score *= PREFIX_FACTOR
+                word_scores[doc] = max(word_scores.get(doc, 0.0), score)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = dict((doc, score + word_scores[doc])
+                              for doc, score in scores.items()
+                              if doc in word_scores)
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda item: -item[1])
+        if limit:
+            ranked = ranked[:limit]
+        matches = []
+        for doc, score in ranked:
+            task_list, position, task_id, text = self.db.execute(
+                'SELECT list, position, task_id, text FROM docs WHERE doc=?',
+                (doc,)).fetchone()
+            matches.append(Match(score, task_list, position, task_id, text))
+        return matches
+
+    def _count(self, account, lists):
+        sql = 'SELECT COUNT(*) FROM docs WHERE account=?'
+        params = [account]
+        if lists:
+            sql += ' AND list IN (%s)' % ','.join('?' * len(lists))
+            params += list(lists)
+        return self.db.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+On-disk snapshots of task lists, one file per account and task type.
+
+A snapshot remembers the ETag of the response it was built from, so a
+listing costs a single conditional GET that the server answers with an
+empty 304 when nothing changed. Commands that change tasks patch the
+snapshot in place and save it instead of refetching. Listings can
+stream() a changed list instead, rendering and saving it task by task.
+"""
+
+
+import json
+import logging
+import os
+
+
+class SnapshotMissing(Exception):
+    """Raised when an offline read finds no snapshot on disk."""
+
+
+class TaskSnapshot(object):
+    """
+    The last known tasks of one type for one account.
+    """
+
+    def __init__(self, directory, account, task_type):
+        self.account = account
+        self.task_type = task_type
+        self.path = os.path.join(directory, '%s-%s.json' % (account, task_type))
+        self.etag = None
+        self.tasks = None
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        self.etag = data.get('etag')
+        self.tasks = data.get('tasks')
+
+    def _tmp_path(self):
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        return '%s.%d.tmp' % (self.path, os.getpid())
+
+    def save(self):
+        """Write the snapshot atomically, so readers never see half a file."""
+        tmp = self._tmp_path()
+        with open(tmp, 'w') as f:
+            json.dump({'etag': self.etag, 'tasks': self.tasks}, f)
+        os.replace(tmp, self.path)
+
+    def _request(self, hbt, **kwargs):
+        headers = {}
+        if self.etag and self.tasks is not None:
+            headers['If-None-Match'] = self.etag
+        return hbt.tasks.user(type=self.task_type, _headers=headers,
+                              _raw=True, **kwargs)
+
+    def fetch(self, hbt, offline=False):
+        """
+        Return the current tasks, revalidating the snapshot with the server
+        unless `offline` is set.
+        """
+        from .api import decode
+
+        if offline:
+            if self.tasks is None:
+                raise SnapshotMissing('no %s snapshot at %s'
+                                      % (self.task_type, self.path))
+            return self.tasks
+
+        res = self._request(hbt)
+        if res.status_code == 304:
+            logging.debug('%s snapshot is up to date' % self.task_type)
+            return self.tasks
+
+        logging.debug('Refreshing %s snapshot' % self.task_type)
+        self.tasks = decode(res)['data']
+        self.etag = res.headers.get('ETag')
+        self.save()
+        return self.tasks
+
+    def stream(self, hbt, offline=False):
+        """
+        Like fetch(), but yield the tasks one by one. A changed list is
+        decoded and written to the snapshot as it downloads and never
+        held in memory as a whole; `.tasks` is left unset in that case.
+        """
+        from .api import iter_data
+
+        if offline:
+            for task in self.fetch(hbt, offline=True):
+                yield task
+            return
+        res = self._request(hbt, _stream=True)
+        if res.status_code == 304:
+            res.close()
+            logging.debug('%s snapshot is up to date' % self.task_type)
+            for task in self.tasks:
+                yield task
+            return
+
+        logging.debug('Streaming %s snapshot' % self.task_type)
+        self.tasks = None
+        self.etag = res.headers.get('ETag')
+        tmp = self._tmp_path()
+        complete = False
+        try:
+            with open(tmp, 'w') as f:
+                f.write('{"etag": %s, "tasks": [' % json.dumps(self.etag))
+                for i, task in enumerate(iter_data(res)):
+                    if i:
+                        f.write(', ')
+                    json.dump(task, f)
+                    yield task
+                f.write(']}')
+            complete = True
+        finally:
+            if complete:
+                os.replace(tmp, self.path)
+            elif os.path.exists(tmp):
+                os.remove(tmp)
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Task history analytics for `habitica stats`, vectorized with NumPy.
+
+The `history` of every habit and daily is loaded in one pass into flat
+columns (owning task, date, day, value, completed, due) sorted by task
+and date. Per-task results then come from whole-array operations rather
+than a Python loop over entries: current and longest streaks,
+completion rates per weekday, the value trend over the last days, and
+the value after N more scores.
+
+NumPy is an optional dependency (`pip install numpy`); core.stats_command
+reports it missing when importing this module fails.
+"""
+
+
+from datetime import datetime, timezone
+
+import numpy as np
+
+from .core import TASK_VALUE_BASE
+
+DAY_MS = 86400000
+PROJECTED_SCORES = 10  # default number of scores `stats` projects
+TREND_DAYS = 30  # the value trend is fitted over each task's last days
+# the server clamps a task's value to this range before computing the
+# change a score makes (TASK_VALUE_BASE ** value)
+TASK_VALUE_MIN = -47.27
+TASK_VALUE_MAX = 21.27
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday
+
+
+def _date_ms(date):
+    """A history date (ms since the epoch, or an ISO string) in ms."""
+    if isinstance(date, str):
+        if date.isdigit():
+            return int(date)
+        parsed = datetime.strptime(date[:19], '%Y-%m-%dT%H:%M:%S')
+        return int(parsed.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return int(date or 0)
+
+
+def _done(entry):
+    """1 if the entry says the task was done, 0 if not, -1 if it doesn't say."""
+    completed = entry.get('completed')
+    if completed is not None:
+        return 1 if completed else 0
+    scored_up = entry.get('scoredUp')
+    if scored_up is not None:
+        return 1 if scored_up else 0
+    return -1
+
+
+def project(values, scores=PROJECTED_SCORES, direction=1):
+    """Task `values` after `scores` more scores up (1) or down (-1)."""
+    values = np.array(values, dtype=float)
+    for _ in range(scores):
+        values += direction * TASK_VALUE_BASE ** np.clip(
+            values, TASK_VALUE_MIN, TASK_VALUE_MAX)
+    return values
+
+
+class History(object):
+    """
+    The history entries of `tasks` (task dicts) as columns sorted by task
+    and date, entry i belonging to `tasks[task[i]]`.
+
+    Dailies are recorded by the cron that closes their day, so their
+    entries count for the day before their date. Days start at midnight
+    `utc_offset` ms from UTC. Entries without a completed (dailies) or
+    scoredUp (habits) field count as done when they raised the value.
+    """
+
+    def __init__(self, tasks, utc_offset=0):
+        self.tasks = list(tasks)
+        histories = [task.get('history') or () for task in self.tasks]
+        counts = np.fromiter((len(history) for history in histories),
+                             dtype=np.int64, count=len(histories))
+        entries = [entry for history in histories for entry in history]
+        n = len(entries)
+
+        task = np.repeat(np.arange(len(self.tasks)), counts)
+        try:
+            date = np.fromiter((entry['date'] for entry in entries),
+                               dtype=np.float64, count=n).astype(np.int64)
+        except (KeyError, TypeError, ValueError):
+            date = np.fromiter((_date_ms(entry.get('date'))
+                                for entry in entries), dtype=np.int64, count=n)
+        value = np.fromiter((entry.get('value') or 0.0 for entry in entries),
+                            dtype=np.float64, count=n)
+        try:  # > 0: done, 0: not done, < 0: doesn't say
+            done = np.fromiter((entry.get('completed',
+                                          entry.get('scoredUp', -1))
+                                for entry in entries),
+                               dtype=np.float64, count=n)
+        except TypeError:  # explicit nulls
+            done = np.fromiter((_done(entry) for entry in entries),
+                               dtype=np.float64, count=n)
+        due = np.fromiter((entry.get('isDue') is not False
+                           for entry in entries), dtype=bool, count=n)
+
+        same_task = task[1:] == task[:-1]
+        if not (np.diff(date)[same_task] >= 0).all():
+            order = np.lexsort((date, task))
+            task, date, value, done, due = (task[order], date[order],
+                                            value[order], done[order],
+                                            due[order])
+
+        # first and last entry of every task that has any
+        self.first = np.flatnonzero(np.r_[True, ~same_task]) if n else \
+            np.zeros(0, dtype=np.int64)
+        self.last = np.r_[self.first[1:] - 1, n - 1] if n else self.first
+        self.owner = task[self.first]
+
+        # unknown completion: did the score raise the value (from 0)?
+        delta = np.diff(value, prepend=0.0)
+        delta[self.first] = value[self.first]
+        self.done = np.where(done < 0, delta > 0, done > 0)
+
+        daily = np.array([t.get('type') == 'daily' for t in self.tasks],
+                         dtype=np.int64)
+        self.task = task
+        self.date = date
+        self.value = value
+        self.due = due
+        self.day = (date + utc_offset) // DAY_MS - daily[task]
+        self.weekday = (self.day + EPOCH_WEEKDAY) % 7
+
+    def __len__(self):
+        return len(self.task)
+
+    def streaks(self):
+        """Current and longest run of done (due) entries of each task."""
+        current = np.zeros(len(self.tasks), dtype=np.int64)
+        longest = np.zeros(len(self.tasks), dtype=np.int64)
+        task = self.task[self.due]
+        done = self.done[self.due]
+        if not len(task):
+            return current, longest
+        starts = np.flatnonzero(np.r_[True, (task[1:] != task[:-1]) |
+                                      (done[1:] != done[:-1])])
+        lengths = np.diff(np.r_[starts, len(task)])
+        run_task = task[starts]
+        run_done = done[starts]
+        np.maximum.at(longest, run_task[run_done], lengths[run_done])
+        last = np.flatnonzero(np.r_[run_task[1:] != run_task[:-1], True])
+        current[run_task[last]] = np.where(run_done[last], lengths[last], 0)
+        return current, longest
+
+    def weekday_rates(self):
+        """
+        Share of due entries done, per task and weekday (Monday first) as a
+        (tasks, 7) array, then over all tasks; NaN where nothing was due.
+        """
+        index = self.task[self.due] * 7 + self.weekday[self.due]
+        size = len(self.tasks) * 7
+        total = np.bincount(index, minlength=size).reshape(-1, 7)
+        done = np.bincount(index, weights=self.done[self.due],
+                           minlength=size).reshape(-1, 7)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return done / total, done.sum(axis=0) / total.sum(axis=0)
+
+    def trends(self, days=TREND_DAYS):
+        """
+        Least-squares slope of each task's value, per day, over its last
+        `days` days of history; NaN for tasks with fewer than two days.
+        """
+        size = len(self.tasks)
+        last_day = np.zeros(size, dtype=np.int64)
+        last_day[self.owner] = self.day[self.last]
+        recent = self.day > last_day[self.task] - days
+        task = self.task[recent]
+        x = (self.day[recent] - last_day[task]).astype(np.float64)
+        y = self.value[recent]
+        count = np.bincount(task, minlength=size)
+        sx = np.bincount(task, weights=x, minlength=size)
+        sy = np.bincount(task, weights=y, minlength=size)
+        sxx = np.bincount(task, weights=x * x, minlength=size)
+        sxy = np.bincount(task, weights=x * y, minlength=size)
+        denominator = count * sxx - sx * sx
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (count * sxy - sx * sy) / denominator
+        slope[denominator == 0] = np.nan
+        return slope
+
+    def summary(self, scores=PROJECTED_SCORES):
+        """All per-task results, as a dict of arrays indexed like `tasks`."""
+        values = np.array([task.get('value') or 0.0 for task in self.tasks],
+                          dtype=np.float64)
+        streak, longest_streak = self.streaks()
+        weekday_rate, weekday_total = self.weekday_rates()
+        return {'value': values,
+                'streak': streak,
+                'longest_streak': longest_streak,
+                'weekday_rate': weekday_rate,
+                'weekday_total': weekday_total,
+                'trend': self.trends(),
+                'projected_up': project(values, scores, 1),
+                'projected_down': project(values, scores, -1)}
+
+    def export(self, path, summary):
+        """Write the columns, task fields and `summary` to `path` (.npz)."""
+        np.savez(path,
+                 task_id=np.array([t.get('id') or '' for t in self.tasks],
+                                  dtype=str),
+                 task_type=np.array([t.get('type') or '' for t in self.tasks],
+                                    dtype=str),
+                 task_text=np.array([t.get('text') or '' for t in self.tasks],
+                                    dtype=str),
+                 task=self.task, date=self.date, day=self.day,
+                 value_history=self.value, done=self.done, due=self.due,
+                 **summary)
+
+
+def report_lines(history, summary, scores):
+    """The `habitica stats` table: one line per task, then weekdays."""
+    lines = []
+    positions = {}
+    titles = {'habit': 'habits', 'daily': 'dailies'}
+    for i, task in enumerate(history.tasks):
+        task_type = task.get('type')
+        if task_type not in positions:
+            positions[task_type] = 0
+            lines.append('%-8s %7s %6s %5s %9s %8s' % (
+                titles.get(task_type, task_type), 'value', 'streak', 'best',
+                'trend/d', 'after %d' % scores))
+        positions[task_type] += 1
+        trend = summary['trend'][i]
+        lines.append('%8d %7.1f %6d %5d %9s %8.1f  %s' % (
+            positions[task_type], summary['value'][i], summary['streak'][i],
+            summary['longest_streak'][i],
+            '-' if np.isnan(trend) else '%+.2f' % trend,
+            summary['projected_up'][i], task.get('text', '').encode('utf8')))
+    rates = ['%s %s' % (day, '-' if np.isnan(rate) else '%d%%' % (100 * rate))
+             for day, rate in zip(WEEKDAYS, summary['weekday_total'])]
+    lines.append('done by weekday: ' + ' '.join(rates))
+    return lines
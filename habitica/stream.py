@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental decoding of JSON list responses.
+
+Habitica wraps lists in an envelope like {"success": true, "data": [...]}.
+iter_json_items() walks such a document chunk by chunk and yields the
+items of one top-level array as soon as each of them is complete, so
+callers can render the first tasks while the rest is still downloading,
+without ever holding the whole body in memory.
+"""
+
+
+import codecs
+import json
+
+STREAM_CHUNK_SIZE = 16 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_TAIL = '.eE+-'
+
+
+class _Reader(object):
+    """A text buffer over byte chunks that only keeps the unparsed part."""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.exhausted = False
+
+    def more(self):
+        for chunk in self.chunks:
+            if chunk:
+                self.buf = self.buf[self.pos:] + self.utf8.decode(chunk)
+                self.pos = 0
+                return True
+        self.exhausted = True
+        return False
+
+    def peek(self):
+        """Next non-whitespace character, without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.more():
+                raise ValueError('Truncated JSON document')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected %r at %r' % (chars, self.buf[self.pos:self.pos + 20]))
+        self.pos += 1
+        return char
+
+    def value(self, decoder):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except ValueError:
+                if not self.more():
+                    raise
+                continue
+            # a number cut off by the end of the buffer may still go on
+            # (12 -> 123, 4 -> 4.5e3)
+            partial = end == len(self.buf) or self.buf[end] in _NUMBER_TAIL
+            if partial and not self.exhausted and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_items(chunks, key='data'):
+    """
+    Yield the items of the top-level array `key` of the JSON object
+    spread over `chunks` (byte strings, e.g. Response.iter_content()).
+    Members after the array are not read.
+    """
+    decoder = json.JSONDecoder()
+    reader = _Reader(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.value(decoder)
+        reader.expect(':')
+        if name == key and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                return
+            while True:
+                yield reader.value(decoder)
+                if reader.expect(',]') == ']':
+                    return
+        reader.value(decoder)
+        if reader.expect(',}') == '}':
+            return
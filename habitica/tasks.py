@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compact in-memory model of Habitica tasks.
+
+The API hands out tasks as big JSON dicts. Commands only need a handful
+of their fields, so tasks are loaded into __slots__ records, and kept in
+a TaskList indexed by id, by type and by display position.
+"""
+
+
+from collections import OrderedDict
+
+
+class ChecklistItem(object):
+    __slots__ = ('id', 'text', 'completed')
+
+    def __init__(self, id=None, text='', completed=False):
+        self.id = id
+        self.text = text
+        self.completed = completed
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('id'), data.get('text', ''),
+                   data.get('completed', False))
+
+    def to_dict(self):
+        return {'id': self.id, 'text': self.text, 'completed': self.completed}
+
+
+class Task(object):
+    """One habit, daily or todo, with the fields the CLI uses."""
+
+    __slots__ = ('id', 'type', 'text', 'notes', 'tags', 'completed', 'value',
+                 'priority', 'date', 'checklist', 'history')
+
+    def __init__(self, id=None, type=None, text='', notes='', tags=(),
+                 completed=False, value=0.0, priority=1, date=None,
+                 checklist=(), history=()):
+        self.id = id
+        self.type = type
+        self.text = text
+        self.notes = notes
+        self.tags = list(tags)
+        self.completed = completed
+        self.value = value
+        self.priority = priority
+        self.date = date
+        self.checklist = list(checklist)
+        self.history = list(history)
+
+    @classmethod
+    def from_dict(cls, data):
+        date = data.get('date')
+        return cls(id=data.get('id'), type=data.get('type'),
+                   text=data.get('text', ''), notes=data.get('notes', ''),
+                   tags=data.get('tags', ()),
+                   completed=data.get('completed', False),
+                   value=data.get('value', 0.0),
+                   priority=data.get('priority', 1),
+                   date=date if date and date != 'None' else None,
+                   checklist=[ChecklistItem.from_dict(item)
+                              for item in data.get('checklist', ())],
+                   history=data.get('history', ()))
+
+    def to_dict(self):
+        data = dict((name, getattr(self, name)) for name in self.__slots__)
+        data['checklist'] = [item.to_dict() for item in self.checklist]
+        return data
+
+    def __repr__(self):
+        return '<Task %s %r>' % (self.type, self.text)
+
+
+class TaskList(object):
+    """
+    Tasks in display order, indexed by id and position.
+
+    Lookups by id are O(1), and so are removals and moves to the top or
+    bottom; the position index is rebuilt lazily, once, the next time a
+    task is looked up by position after the order changed.
+    """
+
+    def __init__(self, tasks=()):
+        self._by_id = OrderedDict()
+        self._positions = None
+        for task in tasks:
+            self.add(task)
+
+    @classmethod
+    def from_dicts(cls, dicts):
+        return cls(Task.from_dict(data) for data in dicts)
+
+    def to_dicts(self):
+        return [task.to_dict() for task in self]
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __getitem__(self, position):
+        """The task at 0-based display `position`."""
+        if self._positions is None:
+            self._positions = list(self._by_id.values())
+        return self._positions[position]
+
+    def get(self, task_id):
+        return self._by_id.get(task_id)
+
+    def resolve(self, positions):
+        """Tasks at the 0-based `positions` (see core.get_task_ids)."""
+        return [self[position] for position in positions]
+
+    def add(self, task, top=False):
+        """
+        Append `task`, or put it first with `top`. A task whose id is
+        already listed is replaced where it stands.
+        """
+        replacing = task.id in self._by_id
+        self._by_id[task.id] = task
+        if top and not replacing:
+            self.move(task.id, top=True)
+        self._positions = None
+
+    def remove(self, task_id):
+        task = self._by_id.pop(task_id)
+        self._positions = None
+        return task
+
+    def move(self, task_id, top=True):
+        """Move a task to the top (or the bottom) of the list."""
+        self._by_id.move_to_end(task_id, last=not top)
+        self._positions = None